@@ -0,0 +1,605 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- YAPILANDIRMA ---
+NOTEBOOK_FILE = "spring-boot-llm-tool.py"
+RAW_RAG_FILE = "rag_data.json"                      # LlamaParse çıktısı
+CLEANER_INPUT_FILE = "spring_boot_rag_llamaparse.json"  # Temizleyici hücresinin beklediği dosya adı
+QA_FILE = "spring_boot_finetune_full.jsonl"         # Sorgu seti (instruction/output çiftleri)
+
+RECALL_KS = [1, 3, 5, 10]
+SEARCH_DEPTH = 10
+STUB_ANSWER = "Bu bir benchmark cevabıdır. RestClient kullanın."
+
+# prefix-cache modu: rastgele ağırlıklı küçük bir Llama ile CPU'da greedy üretim
+TINY_LLAMA_SPECIAL_TOKENS = ["<|begin_of_text|>", "<|end_of_text|>", "<|start_header_id|>",
+                             "<|end_header_id|>", "<|eot_id|>", "<|pad|>"]
+TINY_LLAMA_VOCAB_SIZE = 1000
+PREFIX_CHECK_PROMPTS = 4          # Tür başına (çeviri, RAG) prompt sayısı
+PREFIX_CHECK_NEW_TOKENS = 24
+
+# rerank modu: cross-encoder puanlama gecikmesi (aday sayısı x token sınırı taraması)
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_SWEEP_CANDIDATES = (5, 10, 20)
+RERANK_SWEEP_MAX_LENGTHS = (128, 256)
+RERANK_BENCH_QUERIES = 30
+
+# Notebook hücreleri bu başlıklarla ayrılır
+CELL_HEADER = re.compile(r"^# =+\n# (.+)\n# =+\n", re.MULTILINE)
+
+
+def load_notebook_cells(path):
+    """
+    Notebook'u (spring-boot-llm-tool.py) hücrelerine böler: {başlık: kaynak kod}.
+    Benchmark, RAG kurulumunu kopyalamak yerine notebook'taki kodun kendisini çalıştırır.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    headers = list(CELL_HEADER.finditer(source))
+    cells = {}
+    for i, match in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(source)
+        cells[match.group(1).strip()] = source[match.start():end]
+    return cells
+
+
+def find_cell(cells, prefix):
+    for title, code in cells.items():
+        if title.startswith(prefix):
+            return code
+    raise KeyError(f"Hücre bulunamadı: {prefix}")
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    arr = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p90_ms": round(float(np.percentile(arr, 90)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+    }
+
+
+def peak_rss_mb():
+    # Linux'ta ru_maxrss KB cinsindendir
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# --- STUB BİLEŞENLER (GPU / ağ gerektirmez) ---
+class HashingEmbeddings(Embeddings):
+    """
+    MiniLM indirilemeyen (ağsız) makineler için deterministik kelime-hash embedder'ı.
+    Kalite ölçümü için değil, hız ve hattın uçtan uca çalıştığını doğrulamak içindir.
+    """
+    def __init__(self, model_name=None, model_kwargs=None, encode_kwargs=None, dim=384):
+        self.dim = dim
+        self.encode_kwargs = dict(encode_kwargs or {})
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"[\w@.\-]+", text.lower()):
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class StubBatch(dict):
+    def to(self, device):
+        return self
+
+
+class StubTokenizer:
+    """
+    Kelime/noktalama seviyesinde basit tokenizer. Scheduler ve bağlam paketleyicinin
+    kullandığı arayüzün (encode, __call__, batch_decode) küçük bir alt kümesi.
+    """
+    pad_token = "<pad>"
+    eos_token = "<eos>"
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def __init__(self):
+        self.padding_side = "left"
+        self.vocab = {self.pad_token: 0, self.eos_token: 1}
+        self.words = [self.pad_token, self.eos_token]
+
+    def _ids(self, text):
+        ids = []
+        for word in re.findall(r"\w+|[^\w\s]|\s+", text):
+            if word not in self.vocab:
+                self.vocab[word] = len(self.words)
+                self.words.append(word)
+            ids.append(self.vocab[word])
+        return ids
+
+    def encode(self, text, add_special_tokens=False):
+        return self._ids(text)
+
+    def __call__(self, texts, return_tensors=None, padding=False, add_special_tokens=True):
+        import torch
+        rows = [self._ids(t) for t in texts]
+        if return_tensors != "pt":
+            return {"input_ids": rows}
+        width = max(len(r) for r in rows)
+        input_ids = torch.zeros((len(rows), width), dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        for i, row in enumerate(rows):
+            input_ids[i, width - len(row):] = torch.tensor(row, dtype=torch.long)
+            attention_mask[i, width - len(row):] = 1
+        return StubBatch(input_ids=input_ids, attention_mask=attention_mask)
+
+    def decode(self, ids, skip_special_tokens=True):
+        ids = ids.tolist() if hasattr(ids, "tolist") else ids
+        if skip_special_tokens:
+            ids = [i for i in ids if i > 1]
+        return "".join(self.words[i] for i in ids)
+
+    def batch_decode(self, rows, skip_special_tokens=True):
+        return [self.decode(row, skip_special_tokens) for row in rows]
+
+
+class StubModel:
+    """
+    Sabit bir cevap "üreten" model. Token başına gecikme verilebilir;
+    böylece uçtan uca ölçümde sadece hattın (çeviri, arama, prompt) maliyeti görünür.
+    """
+    def __init__(self, tokenizer, answer=STUB_ANSWER, token_latency_ms=0.0):
+        self.answer_ids = tokenizer.encode(answer) + [tokenizer.eos_token_id]
+        self.token_latency = token_latency_ms / 1000
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=16, streamer=None, **kwargs):
+        import torch
+        new_ids = self.answer_ids[:max_new_tokens]
+        if self.token_latency:
+            time.sleep(self.token_latency * len(new_ids))
+        tail = torch.tensor([new_ids] * input_ids.shape[0], dtype=torch.long)
+        return torch.cat([input_ids, tail], dim=1)
+
+
+def build_tiny_llama(texts, seed=0):
+    """
+    Llama 3 özel token'larını tanıyan küçük bir BPE tokenizer ve rastgele ağırlıklı LlamaForCausalLM.
+    Cevaplar anlamsızdır; amaç aynı girdide birebir aynı token'ların üretildiğini doğrulamaktır.
+    """
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=TINY_LLAMA_VOCAB_SIZE, special_tokens=TINY_LLAMA_SPECIAL_TOKENS,
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet(), show_progress=False)
+    bpe.train_from_iterator(texts, trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, bos_token="<|begin_of_text|>",
+                                        eos_token="<|eot_id|>", pad_token="<|pad|>")
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=4096,
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.pad_token_id,
+    )
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config.do_sample = False
+    return model, tokenizer
+
+
+class RandomCrossEncoder:
+    """
+    ms-marco-MiniLM-L-6-v2 ile aynı mimaride (6 katman, 384 boyut, 12 head) rastgele ağırlıklı cross-encoder.
+    Puanlar anlamsızdır; model indirmeden (ağsız) puanlama gecikmesini ölçmek içindir.
+    CrossEncoder.predict arayüzünün kullanılan kısmını taklit eder.
+    """
+    def __init__(self, texts, max_length, seed=0):
+        import torch
+        from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors, trainers
+        from transformers import BertConfig, BertForSequenceClassification, PreTrainedTokenizerFast
+
+        wordpiece = Tokenizer(models.WordPiece(unk_token="[UNK]"))
+        wordpiece.normalizer = normalizers.BertNormalizer(lowercase=True)
+        wordpiece.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+        special = ["[PAD]", "[UNK]", "[CLS]", "[SEP]"]
+        wordpiece.train_from_iterator(texts, trainers.WordPieceTrainer(vocab_size=30522, special_tokens=special,
+                                                                      show_progress=False))
+        cls_id, sep_id = wordpiece.token_to_id("[CLS]"), wordpiece.token_to_id("[SEP]")
+        wordpiece.post_processor = processors.TemplateProcessing(
+            single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B:1 [SEP]:1",
+            special_tokens=[("[CLS]", cls_id), ("[SEP]", sep_id)],
+        )
+        self.tokenizer = PreTrainedTokenizerFast(tokenizer_object=wordpiece, pad_token="[PAD]", unk_token="[UNK]",
+                                                 cls_token="[CLS]", sep_token="[SEP]")
+        torch.manual_seed(seed)
+        config = BertConfig(vocab_size=30522, hidden_size=384, num_hidden_layers=6, num_attention_heads=12,
+                            intermediate_size=1536, num_labels=1)
+        self.model = BertForSequenceClassification(config).eval()
+        self.max_length = max_length
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        import torch
+        features = self.tokenizer([q for q, _ in pairs], [d for _, d in pairs], padding=True,
+                                  truncation="longest_first", max_length=self.max_length, return_tensors="pt")
+        with torch.inference_mode():
+            return self.model(**features).logits[:, 0].numpy()
+
+
+def load_cross_encoder(kind, texts, max_length):
+    if kind == "random":
+        return RandomCrossEncoder(texts, max_length)
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL_NAME, device="cpu", max_length=max_length)
+
+
+# --- SORGU SETİ & ALTIN ETİKETLER ---
+def load_queries(path, limit):
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if item.get("instruction") and item.get("output"):
+                queries.append(item)
+            if limit and len(queries) >= limit:
+                break
+    return queries
+
+
+def label_source_chunks(queries, documents, tokenize):
+    """
+    QA verisinde kaynak chunk bilgisi yok. Her cevabın kaynağı, cevaptaki terimleri
+    en çok içeren chunk kabul edilir (kapsama oranı; BM25 ağırlığı kullanılmaz).
+    """
+    doc_terms = [set(tokenize(d.page_content)) for d in documents]
+    labels = []
+    for item in queries:
+        answer_terms = set(tokenize(item["output"]))
+        if not answer_terms:
+            labels.append(None)
+            continue
+        overlaps = [len(answer_terms & terms) for terms in doc_terms]
+        labels.append(int(np.argmax(overlaps)))
+    return labels
+
+
+# --- ÖLÇÜMLER ---
+def run_cell(code, namespace, label):
+    start = time.perf_counter()
+    exec(compile(code, f"<{NOTEBOOK_FILE}: {label}>", "exec"), namespace)
+    return time.perf_counter() - start
+
+
+def prepare_namespace(embedder):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    if embedder == "minilm":
+        from langchain_huggingface import HuggingFaceEmbeddings
+    else:
+        HuggingFaceEmbeddings = HashingEmbeddings
+
+    # Hücreler gerçek bir modülün içinde çalışır; temizleyicinin süreç havuzu
+    # hücre fonksiyonlarını bu modül adıyla bulup alt süreçlere gönderebilir.
+    module = types.ModuleType("benchmark_notebook")
+    sys.modules[module.__name__] = module
+    ns = module.__dict__
+    ns.update({
+        "os": os,
+        "json": json,
+        "FAISS": FAISS,
+        "Document": Document,
+        "HuggingFaceEmbeddings": HuggingFaceEmbeddings,
+    })
+    return ns
+
+
+def benchmark_retrieval(ns, queries, labels, query_field):
+    documents = ns["documents"]
+    vector_db = ns["vector_db"]
+    embed_model = ns["embed_model"]
+    bm25_index = ns.get("bm25_index")
+    position_of = {id(doc): pos for pos, doc in enumerate(documents)}
+    doc_ids = ns["rag_doc_ids"]
+    docstore_position = {doc_id: pos for pos, doc_id in enumerate(doc_ids)}
+
+    timings = {"embed": [], "faiss": [], "bm25": [], "hybrid": []}
+    hits = {name: {k: 0 for k in RECALL_KS} for name in ("faiss", "bm25", "hybrid")}
+    evaluated = 0
+
+    for item, gold in zip(queries, labels):
+        if gold is None:
+            continue
+        evaluated += 1
+        query = item[query_field]
+
+        start = time.perf_counter()
+        query_vector = embed_model.embed_query(query)
+        timings["embed"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        _, ids = vector_db.index.search(np.asarray([query_vector], dtype=np.float32), SEARCH_DEPTH)
+        timings["faiss"].append((time.perf_counter() - start) * 1000)
+        rankings = {"faiss": [docstore_position[vector_db.index_to_docstore_id[int(i)]] for i in ids[0] if i != -1]}
+
+        if bm25_index is not None:
+            start = time.perf_counter()
+            rankings["bm25"] = bm25_index.search(query, SEARCH_DEPTH)
+            timings["bm25"].append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            docs = ns["hybrid_search"](query, query_vector, k=SEARCH_DEPTH)
+            timings["hybrid"].append((time.perf_counter() - start) * 1000)
+            rankings["hybrid"] = [position_of[id(d)] for d in docs]
+
+        for name, ranking in rankings.items():
+            for k in RECALL_KS:
+                if gold in ranking[:k]:
+                    hits[name][k] += 1
+
+    report = {"queries": evaluated, "latency": {}, "recall": {}}
+    for name, samples in timings.items():
+        if samples:
+            report["latency"][name] = percentiles(samples)
+    for name, per_k in hits.items():
+        if timings[name]:
+            report["recall"][name] = {f"@{k}": round(v / max(evaluated, 1), 4) for k, v in per_k.items()}
+    return report
+
+
+def benchmark_index(ns, backends=("ivfpq", "hnsw_sq8")):
+    # Aynı embedding matrisinden her sıkıştırılmış index türünü kurup flat'e karşı ölçer
+    embeddings = np.asarray(ns["rag_embeddings"], dtype=np.float32)
+    ids = [r["id"] for r in ns["rag_records"]]
+    report = {}
+    for backend in backends:
+        start = time.perf_counter()
+        index = ns["build_vector_index"](backend, embeddings, ids)
+        build_seconds = round(time.perf_counter() - start, 3)
+        rows = ns["index_quality_report"](index, embeddings, ids)
+        report[backend] = {
+            "build_seconds": build_seconds,
+            "sweep": [
+                {"index": kind, "param": name, "value": value, "recall@10": round(float(recall), 4),
+                 "ms_per_query": round(latency_ms, 4), "size_mb": round(nbytes / 2**20, 2)}
+                for kind, name, value, recall, latency_ms, nbytes in rows
+            ],
+        }
+    return report
+
+
+def memory_report(ns):
+    import faiss
+    report = {
+        "peak_rss_mb": peak_rss_mb(),
+        "faiss_index_mb": round(faiss.serialize_index(ns["vector_db"].index).nbytes / 2**20, 2),
+        "embeddings_mb": round(ns["rag_embeddings"].nbytes / 2**20, 2),
+    }
+    bm25_index = ns.get("bm25_index")
+    if bm25_index is not None:
+        nbytes = bm25_index.doc_ids.nbytes + bm25_index.weights.nbytes + bm25_index.offsets.nbytes
+        report["bm25_postings_mb"] = round(nbytes / 2**20, 2)
+    return report
+
+
+def benchmark_chat(ns, cells, queries, token_latency_ms, use_semantic_cache):
+    # pyngrok sadece tünel için gerekir; tünel kodu benchmark'ta çalıştırılmaz
+    sys.modules.setdefault("pyngrok", types.SimpleNamespace(ngrok=types.SimpleNamespace()))
+
+    tokenizer = StubTokenizer()
+    ns.update({
+        "model": StubModel(tokenizer, token_latency_ms=token_latency_ms),
+        "tokenizer": tokenizer,
+        "FastLanguageModel": types.SimpleNamespace(for_inference=lambda m: None),
+        "MAX_SEQ_LENGTH": 2048,
+    })
+    server_cell = find_cell(cells, "HÜCRE 5")
+    server_cell = server_cell[:server_cell.index("# Ngrok Tüneli")]
+    run_cell(server_cell, ns, "HÜCRE 5")
+    ns["inference_scheduler"].device = "cpu"
+    if not use_semantic_cache:
+        ns["semantic_cache"] = None
+
+    client = ns["app"].test_client()
+    latencies, errors = [], 0
+    for item in queries:
+        start = time.perf_counter()
+        response = client.post("/chat", json={"question": item["instruction"]})
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors += 1
+
+    return {"requests": len(queries), "errors": errors, "latency": percentiles(latencies)}
+
+
+def benchmark_prefix_cache(ns, cells, queries):
+    """
+    Prefix KV cache doğrulaması: aynı prompt'lar kayıtlı prefix'lerle ve prefix'siz iki scheduler'da,
+    tek tek ve batch halinde üretilir; greedy çıktıların hepsi birebir aynı olmalıdır.
+    """
+    sys.modules.setdefault("pyngrok", types.SimpleNamespace(ngrok=types.SimpleNamespace()))
+
+    model, tokenizer = build_tiny_llama([item["instruction"] + "\n" + item["output"] for item in queries])
+    ns.update({
+        "model": model,
+        "tokenizer": tokenizer,
+        "FastLanguageModel": types.SimpleNamespace(for_inference=lambda m: None),
+        "MAX_SEQ_LENGTH": 2048,
+    })
+    server_cell = find_cell(cells, "HÜCRE 5")
+    server_cell = server_cell[:server_cell.index("# Ngrok Tüneli")]
+    run_cell(server_cell, ns, "HÜCRE 5")
+
+    cached = ns["inference_scheduler"]
+    cached.device = "cpu"
+    plain = ns["InferenceScheduler"](model, tokenizer, device="cpu")   # register_prefix çağrılmaz
+
+    questions = [item["instruction"] for item in queries[:PREFIX_CHECK_PROMPTS]]
+    context = "\n\n".join(doc.page_content for doc in ns["documents"][:2])
+    prompt_sets = {
+        "translate": [ns["build_translate_prompt"](q) for q in questions],
+        "answer": [ns["build_rag_prompt"](context, q) for q in questions],
+    }
+
+    def generate(scheduler, prompts, gen_kwargs, batched):
+        start = time.perf_counter()
+        if batched:
+            jobs = [scheduler.submit(prompt, **gen_kwargs) for prompt in prompts]
+            for job in jobs:
+                job.done.wait()
+                if job.error:
+                    raise job.error
+            results = [job.result for job in jobs]
+        else:
+            results = [scheduler.run(prompt, **gen_kwargs).result for prompt in prompts]
+        return results, (time.perf_counter() - start) * 1000
+
+    report = {"prompts": sum(len(p) for p in prompt_sets.values()), "mismatches": [], "ms": {}}
+    for kind, prompts in prompt_sets.items():
+        gen_kwargs = dict(ns["generation_kwargs"](kind), max_new_tokens=PREFIX_CHECK_NEW_TOKENS)
+        for batched in (False, True):
+            mode = f"{kind}_{'batched' if batched else 'single'}"
+            without_cache, plain_ms = generate(plain, prompts, gen_kwargs, batched)
+            with_cache, cached_ms = generate(cached, prompts, gen_kwargs, batched)
+            report["ms"][mode] = {"without_prefix_cache": round(plain_ms, 1), "with_prefix_cache": round(cached_ms, 1)}
+            for position, (a, b) in enumerate(zip(without_cache, with_cache)):
+                if a != b:
+                    report["mismatches"].append({"mode": mode, "prompt": position, "without": a, "with": b})
+
+    report["prefix_cache_used"] = bool(cached.prefix_states)
+    report["identical"] = report["prefix_cache_used"] and not report["mismatches"]
+    print(f"{'✅' if report['identical'] else '❌'} Prefix KV cache çıktıları "
+          f"{'birebir aynı' if report['identical'] else 'FARKLI'} ({report['prompts']} prompt)")
+    return report
+
+
+def benchmark_rerank(ns, queries, kind):
+    """
+    Cross-encoder puanlama gecikmesi (CPU): her sorgu için hibrit aramanın adayları, notebook'taki
+    gibi (bölüm yolu + metin) çiftlere çevrilip tek batch'te puanlanır. RERANK_BUDGET_MS ve
+    RERANK_CANDIDATES bu tablodaki p95 değerlerine göre seçilir.
+    """
+    import torch
+
+    indexing_text = ns["indexing_text"]
+    embed_model = ns["embed_model"]
+    depth = max(RERANK_SWEEP_CANDIDATES)
+    candidate_sets = []
+    for item in queries[:RERANK_BENCH_QUERIES]:
+        query = item["instruction"]
+        docs = ns["hybrid_search"](query, embed_model.embed_query(query), k=depth,
+                                   candidates=max(depth, ns["HYBRID_CANDIDATES"]))
+        candidate_sets.append((query, [indexing_text(d.page_content, d.metadata) for d in docs]))
+
+    texts = [d.page_content for d in ns["documents"]]
+    report = {"model": RERANK_MODEL_NAME if kind != "random" else "random-weight MiniLM-L6-H384",
+              "cpu_threads": torch.get_num_threads(), "queries": len(candidate_sets), "sweep": []}
+    for max_length in RERANK_SWEEP_MAX_LENGTHS:
+        model = load_cross_encoder(kind, texts, max_length)
+        model.predict([("warmup", texts[0])] * depth, batch_size=depth)   # İlk çağrının kurulum maliyeti ölçüme girmez
+        for count in RERANK_SWEEP_CANDIDATES:
+            latencies = []
+            for query, candidates in candidate_sets:
+                pairs = [(query, text) for text in candidates[:count]]
+                start = time.perf_counter()
+                model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+                latencies.append((time.perf_counter() - start) * 1000)
+            row = {"candidates": count, "max_length": max_length, **percentiles(latencies)}
+            report["sweep"].append(row)
+            print(f"🎯 rerank {count:>2} aday x {max_length} token: p50 {row['p50_ms']:.0f} ms, p95 {row['p95_ms']:.0f} ms")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG + chat hattı için çevrimdışı benchmark")
+    parser.add_argument("--mode", choices=["retrieval", "index", "e2e", "prefix-cache", "rerank", "all"],
+                        default="retrieval")
+    parser.add_argument("--embedder", choices=["minilm", "hashing"], default="minilm",
+                        help="hashing: model indirmeden (ağsız) çalışır")
+    parser.add_argument("--reranker", choices=["minilm", "random"], default="minilm",
+                        help="rerank modu; random: aynı mimaride rastgele ağırlıklı model (ağsız)")
+    parser.add_argument("--limit", type=int, default=0, help="Kullanılacak en fazla sorgu (0 = hepsi)")
+    parser.add_argument("--query-field", choices=["instruction", "output"], default="instruction")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Stub modelde token başına gecikme")
+    parser.add_argument("--semantic-cache", action="store_true", help="e2e modunda semantik önbelleği açık bırak")
+    parser.add_argument("--json", dest="json_path", help="Raporu ayrıca bu dosyaya yaz")
+    args = parser.parse_args()
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    cells = load_notebook_cells(os.path.join(repo_dir, NOTEBOOK_FILE))
+    queries = load_queries(os.path.join(repo_dir, QA_FILE), args.limit)
+    print(f"--- BENCHMARK BAŞLIYOR ({args.mode}, embedder={args.embedder}, {len(queries)} sorgu) ---")
+
+    # Notebook dosyaları göreli yollarla yazdığı için her şey geçici bir klasörde çalışır
+    work_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    cwd = os.getcwd()
+    report = {"embedder": args.embedder}
+    try:
+        os.chdir(work_dir)
+        shutil.copy(os.path.join(repo_dir, RAW_RAG_FILE), CLEANER_INPUT_FILE)
+        ns = prepare_namespace(args.embedder)
+
+        report["clean_seconds"] = round(run_cell(find_cell(cells, "RAG DATA CLEANER"), ns, "cleaner"), 3)
+        rag_cell = find_cell(cells, "HÜCRE 4")
+        report["index_build_seconds"] = round(run_cell(rag_cell, ns, "HÜCRE 4 (soğuk)"), 3)
+        report["index_load_seconds"] = round(run_cell(rag_cell, ns, "HÜCRE 4 (sıcak)"), 3)
+        if not ns.get("vector_db"):
+            print("❌ Vektör veritabanı kurulamadı, benchmark durduruldu.")
+            return
+        report["chunks"] = len(ns["documents"])
+
+        if args.mode in ("retrieval", "all"):
+            tokenize = ns.get("tokenize_for_bm25") or (lambda t: re.findall(r"\w+", t.lower()))
+            labels = label_source_chunks(queries, ns["documents"], tokenize)
+            report["retrieval"] = benchmark_retrieval(ns, queries, labels, args.query_field)
+
+        if args.mode in ("index", "all"):
+            report["index"] = benchmark_index(ns)
+
+        if args.mode in ("e2e", "all"):
+            report["chat"] = benchmark_chat(ns, cells, queries, args.token_latency_ms, args.semantic_cache)
+
+        if args.mode in ("rerank", "all"):
+            report["rerank"] = benchmark_rerank(ns, queries, args.reranker)
+
+        if args.mode in ("prefix-cache", "all"):
+            report["prefix_cache"] = benchmark_prefix_cache(ns, cells, queries)
+
+        report["memory"] = memory_report(ns)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\n--- SONUÇLAR ---")
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Rapor kaydedildi: {args.json_path}")
+    if not report.get("prefix_cache", {}).get("identical", True):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
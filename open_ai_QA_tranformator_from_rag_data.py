@@ -1,31 +1,55 @@
+import asyncio
+import hashlib
 import json
 import os
+import random
+import re
+import shutil
 import time
-from openai import OpenAI
+import uuid
+from types import SimpleNamespace
+import openai
+from openai import AsyncOpenAI, OpenAI
 from tqdm import tqdm
 # --- YAPILANDIRMA (Sizin İsteğinize Göre Güncellendi) ---
 API_KEY = "sk-proj-....."
 # BURAYA KENDİ OPENAI API KEY'İNİZİ YAPIŞTIRIN
-INPUT_FILE = "rag_data.json"  
-OUTPUT_FILE = "finetune_data.jsonl" 
+# Yerel bir mock (OpenAI uyumlu) sunucuya karşı denemek için: OPENAI_BASE_URL=http://127.0.0.1:8000/v1
+BASE_URL = os.environ.get("OPENAI_BASE_URL")
+INPUT_FILE = "rag_data.json"
+OUTPUT_FILE = "finetune_data.jsonl"
+
+# Üretim modu: "async" (eşzamanlı istekler), "batch" (OpenAI Batch API) veya "batch-local" (internetsiz yerel taklit)
+GENERATION_MODE = os.environ.get("QA_GENERATION_MODE", "async")
 
 # Model: GPT-4o-mini (Hızlı, Ucuz ve Akıllı)
-MODEL_NAME = "gpt-4o-mini" 
+MODEL_NAME = "gpt-4o-mini"
 
 # LİMİT YOK: Tüm dosyayı işlemek için -1 yapıyoruz
-PROCESS_LIMIT = -1 
+PROCESS_LIMIT = -1
 
-client = OpenAI(api_key=API_KEY)
+# --- EŞZAMANLILIK & RATE LIMIT ---
+MAX_CONCURRENCY = 16          # Aynı anda açık en fazla istek
+REQUESTS_PER_MINUTE = 500     # Başlangıç limiti; sunucunun x-ratelimit-* başlıklarıyla güncellenir
+TOKENS_PER_MINUTE = 200_000
+MAX_OUTPUT_TOKENS_ESTIMATE = 700  # Token bütçesi tahmini için cevap payı
+MAX_RETRIES = 6               # 429 / 5xx / bağlantı hatalarında tekrar deneme sayısı
+BACKOFF_BASE = 1.0            # sn; her denemede 2 katına çıkar
+BACKOFF_MAX = 60.0
 
-def generate_synthetic_data(chunk_text):
-    """
-    GPT-4o-mini'ye metni gönderip 'Instruction Tuning' verisi üretmesini ister.
-    """
-    
-    system_prompt = """
-    Sen uzman bir Spring Boot eğitmenisin. Görevin, sana verilen teknik dokümantasyon parçasından 
+# --- KALDIĞI YERDEN DEVAM & TEKRAR ÖNLEME ---
+# Her chunk'ın içerik hash'i ve sonucu buraya eklenir; tekrar çalıştırmada bitmiş işler atlanır
+CHECKPOINT_FILE = "finetune_data.checkpoint.jsonl"
+DONE_STATUSES = {"ok", "duplicate", "invalid"}  # "failed" olanlar bir sonraki çalıştırmada tekrar denenir
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16             # LSH: 16 bant x 4 satır
+MINHASH_SHINGLE_SIZE = 3       # Kelime 3-gram
+DUPLICATE_THRESHOLD = 0.8      # Tahmini Jaccard benzerliği bunun üstündeyse soru tekrar sayılır
+
+SYSTEM_PROMPT = """
+    Sen uzman bir Spring Boot eğitmenisin. Görevin, sana verilen teknik dokümantasyon parçasından
     "Instruction Fine-Tuning" (Talimat İnce Ayarı) için yüksek kaliteli veri seti üretmektir.
-    
+
     Kurallar:
     1. "instruction" (Soru): Bir yazılımcının karşılaşabileceği gerçekçi ve teknik bir soru olsun.
     2. "output" (Cevap): Dokümandaki bilgiye dayanarak, "Best Practice" vurgusu yapan net bir cevap olsun.
@@ -34,13 +58,14 @@ def generate_synthetic_data(chunk_text):
     5. Çıktı Formatı: Sadece geçerli bir JSON nesnesi.
     """
 
+def build_messages(chunk_text):
     user_prompt = f"""
-    Aşağıdaki metni analiz et. Bu metindeki en önemli bilgiyi öğretecek 
+    Aşağıdaki metni analiz et. Bu metindeki en önemli bilgiyi öğretecek
     1 adet "Soru-Cevap" çifti oluştur.
-    
+
     DOKÜMAN METNİ:
-    {chunk_text[:4000]} 
-    
+    {chunk_text[:4000]}
+
     İSTENEN JSON FORMATI:
     {{
         "instruction": "Soru...",
@@ -48,28 +73,574 @@ def generate_synthetic_data(chunk_text):
         "output": "Cevap..."
     }}
     """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
 
-    try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={ "type": "json_object" }, 
-            temperature=0.6 # Biraz daha tutarlı olması için düşürdük
-        )
-        
-        content = response.choices[0].message.content
-        return json.loads(content)
-        
-    except Exception as e:
-        print(f" Hata: {e}")
+def parse_duration(value):
+    """
+    OpenAI reset başlıklarını saniyeye çevirir: "20ms", "1s", "6m0s", "1h2m3.5s".
+    """
+    if not value:
         return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+class TokenBucket:
+    """
+    Dakikalık limit için token bucket. Sunucunun bildirdiği limit/kalan/sıfırlanma
+    değerleri geldikçe kendini onlara göre ayarlar.
+    """
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.refill_rate = per_minute / 60
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            async with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = max(self.paused_until - now, (amount - self.tokens) / self.refill_rate)
+            await asyncio.sleep(wait)
+
+    def update(self, limit, remaining, reset_seconds):
+        now = time.monotonic()
+        self._refill(now)
+        if limit:
+            self.capacity = limit
+            self.refill_rate = limit / 60
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            # Kota bitti: sıfırlanma anına kadar yeni istek gönderme
+            if remaining <= 0 and reset_seconds:
+                self.paused_until = max(self.paused_until, now + reset_seconds)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class RateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, estimated_tokens):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+    def update_from_headers(self, headers):
+        def number(name):
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        self.requests.update(
+            number("x-ratelimit-limit-requests"),
+            number("x-ratelimit-remaining-requests"),
+            parse_duration(headers.get("x-ratelimit-reset-requests")),
+        )
+        self.tokens.update(
+            number("x-ratelimit-limit-tokens"),
+            number("x-ratelimit-remaining-tokens"),
+            parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        )
+
+    def pause(self, seconds):
+        self.requests.pause(seconds)
+
+def retry_delay(attempt, headers=None):
+    # Sunucu "retry-after" verdiyse ona uy, yoksa jitter'lı exponential backoff
+    if headers:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        retry_after = parse_duration(headers.get("retry-after"))
+        if retry_after is not None:
+            return retry_after
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_checkpoint(path):
+    """
+    Checkpoint dosyasını {chunk_hash: status} olarak okur (aynı hash için son satır geçerlidir).
+    """
+    checkpoint = {}
+    if not os.path.exists(path):
+        return checkpoint
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                checkpoint[entry["hash"]] = entry["status"]
+            except (ValueError, KeyError):
+                continue  # Yarım yazılmış son satır (ani kesinti)
+    return checkpoint
+
+class MinHashDeduplicator:
+    """
+    Soru (instruction) metinleri için MinHash + LSH ile yakın-tekrar tespiti.
+    Komşu/çakışan chunk'lardan üretilen, neredeyse aynı kelimelerle sorulmuş soruları eler.
+    """
+    MERSENNE_PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm, bands, threshold, shingle_size):
+        rng = random.Random(42)  # Sabit tohum: imzalar çalıştırmalar arasında aynı kalsın
+        self.permutations = [
+            (rng.randrange(1, self.MERSENNE_PRIME), rng.randrange(0, self.MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.buckets = {}
+        self.signatures = []
+
+    def _shingles(self, text):
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < self.shingle_size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+            for s in self._shingles(text)
+        ]
+        return tuple(
+            min((a * h + b) % self.MERSENNE_PRIME for h in hashes)
+            for a, b in self.permutations
+        )
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def is_duplicate(self, text):
+        signature = self.signature(text)
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        for idx in candidates:
+            other = self.signatures[idx]
+            similarity = sum(x == y for x, y in zip(signature, other)) / len(signature)
+            if similarity >= self.threshold:
+                return True, signature
+        return False, signature
+
+    def add(self, signature):
+        idx = len(self.signatures)
+        self.signatures.append(signature)
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, []).append(idx)
+
+def load_existing_instructions(path, deduplicator):
+    # Önceki çalıştırmalardan kalan soruları da karşılaştırmaya dahil et
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            instruction = item.get("instruction") if isinstance(item, dict) else None
+            if isinstance(instruction, str) and instruction.strip():
+                deduplicator.add(deduplicator.signature(instruction))
+                count += 1
+    return count
+
+async def generate_synthetic_data(client, limiter, chunk_text):
+    """
+    GPT-4o-mini'ye metni gönderip 'Instruction Tuning' verisi üretmesini ister.
+    429 / 5xx / bağlantı hatalarında backoff ile tekrar dener.
+    """
+    messages = build_messages(chunk_text)
+    estimated_tokens = len(messages[0]["content"] + messages[1]["content"]) // 3 + MAX_OUTPUT_TOKENS_ESTIMATE
+
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire(estimated_tokens)
+        try:
+            raw = await client.chat.completions.with_raw_response.create(
+                model=MODEL_NAME,
+                messages=messages,
+                response_format={ "type": "json_object" },
+                temperature=0.6 # Biraz daha tutarlı olması için düşürdük
+            )
+            limiter.update_from_headers(raw.headers)
+            response = raw.parse()
+
+            content = response.choices[0].message.content
+            return json.loads(content)
+
+        except openai.APIStatusError as e:
+            limiter.update_from_headers(e.response.headers)
+            retryable = e.status_code == 429 or e.status_code >= 500
+            if not retryable or attempt == MAX_RETRIES:
+                print(f" Hata: {e}")
+                return None
+            delay = retry_delay(attempt, e.response.headers)
+            if e.status_code == 429:
+                limiter.pause(delay)
+            await asyncio.sleep(delay)
+
+        except (openai.APIConnectionError, openai.APITimeoutError) as e:
+            if attempt == MAX_RETRIES:
+                print(f" Hata: {e}")
+                return None
+            await asyncio.sleep(retry_delay(attempt))
+
+        except Exception as e:
+            print(f" Hata: {e}")
+            return None
+
+def select_pending(chunks_to_process, checkpoint_file):
+    """
+    İşlenecek chunk'ları (hash, metin, kaynak bilgisi) olarak döndürür.
+    Daha önce tamamlanmış (ya da aynı çalıştırmada tekrar eden) chunk'lar için API çağrısı yapılmaz.
+    """
+    checkpoint = load_checkpoint(checkpoint_file)
+    pending, seen, skipped = [], set(), 0
+    for chunk in chunks_to_process:
+        text = chunk.get("content", "")
+        # Çok kısa metinleri atla (Gürültü veya başlık olabilir)
+        if len(text) < 150:
+            continue
+        digest = chunk_hash(text)
+        if checkpoint.get(digest) in DONE_STATUSES or digest in seen:
+            skipped += 1
+            continue
+        seen.add(digest)
+        metadata = chunk.get("metadata", {})
+        provenance = {
+            "source": metadata.get("source"),
+            "page_label": metadata.get("page_label"),
+            "chunk_hash": digest,
+        }
+        pending.append((digest, text, provenance))
+    print(f"Checkpoint: {skipped} parça atlandı, {len(pending)} parça işlenecek")
+    return pending
+
+def is_valid_pair(qa_pair):
+    # JSON modu geçerli JSON'u garanti eder, alan tiplerini değil ("instruction": null, liste vb.)
+    return isinstance(qa_pair, dict) and all(
+        isinstance(qa_pair.get(field), str) and qa_pair[field].strip() for field in ("instruction", "output")
+    )
+
+class ResultWriter:
+    """
+    Üretilen soru-cevapları tekrar kontrolünden geçirip çıktı dosyasına, sonucu da checkpoint dosyasına yazar.
+    Hem asyncio hem de Batch modu aynı yazıcıyı kullanır.
+    """
+    def __init__(self, output_file, checkpoint_file):
+        self.output_file = output_file
+        self.checkpoint_file = checkpoint_file
+        self.deduplicator = MinHashDeduplicator(MINHASH_PERMUTATIONS, MINHASH_BANDS,
+                                                DUPLICATE_THRESHOLD, MINHASH_SHINGLE_SIZE)
+        existing = load_existing_instructions(output_file, self.deduplicator)
+        if existing:
+            print(f"Tekrar kontrolü için {existing} mevcut soru yüklendi")
+        self.stats = {"ok": 0, "duplicate": 0, "invalid": 0, "failed": 0}
+
+    def __enter__(self):
+        # 'a' (append) modu ile açıyoruz, elektrik kesilirse kaldığı yerden devam eder.
+        self.f_out = open(self.output_file, "a", encoding="utf-8")
+        self.f_ckpt = open(self.checkpoint_file, "a", encoding="utf-8")
+        return self
+
+    def __exit__(self, *exc):
+        self.f_out.close()
+        self.f_ckpt.close()
+        print(f"Sonuçlar: {self.stats}")
+
+    def record(self, digest, qa_pair, provenance):
+        if qa_pair is None:
+            status = "failed"
+        elif not is_valid_pair(qa_pair):
+            status = "invalid"
+        else:
+            duplicate, signature = self.deduplicator.is_duplicate(qa_pair["instruction"])
+            if duplicate:
+                status = "duplicate"
+            else:
+                status = "ok"
+                self.deduplicator.add(signature)
+                # Hangi dokümandan/sayfadan üretildiği satırla birlikte saklanır
+                qa_pair = dict(qa_pair, metadata=provenance)
+                # JSONL satırı olarak yaz
+                self.f_out.write(json.dumps(qa_pair, ensure_ascii=False) + "\n")
+                self.f_out.flush() # Her satırda diske yazmayı garantile
+        self.stats[status] += 1
+
+        # Checkpoint çıktıdan SONRA yazılır: arada kesilirse chunk tekrar üretilir,
+        # yeni soru da MinHash kontrolünde tekrar olarak elenir.
+        self.f_ckpt.write(json.dumps({"hash": digest, "status": status}) + "\n")
+        self.f_ckpt.flush()
+
+    @property
+    def successful(self):
+        return self.stats["ok"]
+
+async def run(pending, paths):
+    # Tekrar denemeleri biz yönetiyoruz, SDK'nın kendi retry'ı kapalı
+    client = AsyncOpenAI(api_key=API_KEY, base_url=BASE_URL, max_retries=0)
+    limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    async def worker(position, text):
+        async with semaphore:
+            return position, await generate_synthetic_data(client, limiter, text)
+
+    results = {}
+    next_position = 0
+
+    with ResultWriter(paths.output, paths.checkpoint) as writer:
+        tasks = [asyncio.create_task(worker(pos, text)) for pos, (_, text, _) in enumerate(pending)]
+        with tqdm(total=len(tasks), unit="parça") as progress:
+            for finished in asyncio.as_completed(tasks):
+                position, qa_pair = await finished
+                results[position] = qa_pair
+                progress.update(1)
+
+                # Sonuçlar bitiş sırasına göre değil, chunk sırasına göre yazılır (deterministik çıktı)
+                while next_position in results:
+                    digest, _, provenance = pending[next_position]
+                    writer.record(digest, results.pop(next_position), provenance)
+                    next_position += 1
+
+    await client.close()
+    return writer.successful
+
+# ==========================================
+# BATCH API MODU (Toplu gönder, sonra topla)
+# ==========================================
+# Tüm istekler tek bir JSONL dosyasına yazılıp Batch API'ye verilir; 24 saat içinde
+# (genelde çok daha kısa) tamamlanır ve senkron isteklere göre yarı fiyatına gelir.
+# "batch-local": Aynı akışı internetsiz deneyebilmek için dosya tabanlı yerel taklit.
+BATCH_REQUESTS_FILE = "finetune_batch_requests.jsonl"
+BATCH_STATE_FILE = "finetune_batch_state.json"   # Gönderilmiş batch'in id'si + custom_id -> chunk eşlemesi
+BATCH_LOCAL_DIR = "batch_local"                  # batch-local'in tüm dosyaları (çıktı, checkpoint, durum) burada kalır
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_MAX_REQUESTS = 50_000                      # Batch API'nin dosya başına istek limiti
+BATCH_POLL_INTERVAL = 30                         # sn
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def build_request_body(chunk_text):
+    # Senkron mod ile birebir aynı istek gövdesi
+    return {
+        "model": MODEL_NAME,
+        "messages": build_messages(chunk_text),
+        "response_format": { "type": "json_object" },
+        "temperature": 0.6,
+    }
+
+class LocalBatchClient:
+    """
+    OpenAI istemcisinin files/batches arayüzünün dosya tabanlı taklidi.
+    İstekleri ağ kullanmadan, doküman metninden basit bir soru-cevap türeterek cevaplar;
+    üretilen veri eğitim için değil, boru hattını uçtan uca denemek içindir.
+    """
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _path(self, object_id):
+        return os.path.join(self.root_dir, object_id)
+
+    def _create_file(self, file, purpose):
+        file_id = f"file-local-{uuid.uuid4().hex[:12]}"
+        with open(self._path(file_id), "wb") as f_out:
+            shutil.copyfileobj(file, f_out)
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def _file_content(self, file_id):
+        with open(self._path(file_id), "r", encoding="utf-8") as f:
+            return SimpleNamespace(text=f.read())
+
+    @staticmethod
+    def _answer(body):
+        user_prompt = body["messages"][-1]["content"]
+        match = re.search(r"DOKÜMAN METNİ:\s*(.*?)\s*İSTENEN JSON FORMATI:", user_prompt, re.S)
+        text = match.group(1) if match else user_prompt
+        heading = re.search(r"^#+\s*(?:[\d.]+\s*)?(.+)$", text, re.M)
+        topic = heading.group(1).strip() if heading else " ".join(text.split()[:8])
+        qa_pair = {
+            "instruction": f"Spring Boot'ta '{topic}' konusu nedir ve nasıl kullanılır?",
+            "input": "",
+            "output": text[:800].strip(),
+        }
+        return {
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(qa_pair, ensure_ascii=False)}}],
+        }
+
+    def _create_batch(self, input_file_id, endpoint, completion_window, metadata=None):
+        # Yerel taklitte batch oluşturulduğu anda işlenir
+        batch_id = f"batch-local-{uuid.uuid4().hex[:12]}"
+        output_file_id = f"file-local-{uuid.uuid4().hex[:12]}"
+        total = 0
+        with open(self._path(input_file_id), "r", encoding="utf-8") as f_in, \
+                open(self._path(output_file_id), "w", encoding="utf-8") as f_out:
+            for line in f_in:
+                request = json.loads(line)
+                total += 1
+                f_out.write(json.dumps({
+                    "id": f"batch_req_{total}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "body": self._answer(request["body"])},
+                    "error": None,
+                }, ensure_ascii=False) + "\n")
+        batch = {
+            "id": batch_id, "status": "completed", "endpoint": endpoint,
+            "input_file_id": input_file_id, "output_file_id": output_file_id, "error_file_id": None,
+            "request_counts": {"total": total, "completed": total, "failed": 0},
+        }
+        with open(self._path(batch_id + ".json"), "w", encoding="utf-8") as f:
+            json.dump(batch, f)
+        return self._retrieve_batch(batch_id)
+
+    def _retrieve_batch(self, batch_id):
+        with open(self._path(batch_id + ".json"), "r", encoding="utf-8") as f:
+            batch = json.load(f)
+        batch["request_counts"] = SimpleNamespace(**batch["request_counts"])
+        return SimpleNamespace(**batch)
+
+def submit_batch(client, pending, paths):
+    if len(pending) > BATCH_MAX_REQUESTS:
+        raise ValueError(f"Batch başına en fazla {BATCH_MAX_REQUESTS} istek gönderilebilir ({len(pending)} var). PROCESS_LIMIT ile bölün.")
+
+    requests = []
+    with open(paths.batch_requests, "w", encoding="utf-8") as f:
+        for position, (digest, text, provenance) in enumerate(pending):
+            custom_id = f"chunk-{position}-{digest[:16]}"
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": build_request_body(text),
+            }, ensure_ascii=False) + "\n")
+            requests.append({"custom_id": custom_id, "hash": digest, "metadata": provenance})
+
+    with open(paths.batch_requests, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+
+    # Gönderilen batch'i kaydet: script kapansa da bir sonraki çalıştırma aynı batch'i bekleyip toplar
+    state = {"batch_id": batch.id, "input_file_id": input_file.id, "requests": requests}
+    with open(paths.batch_state, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    print(f"📦 Batch gönderildi: {batch.id} ({len(requests)} istek)")
+    return state
+
+def wait_for_batch(client, batch_id, poll_interval):
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts:
+            print(f"⏳ {batch.status}: {counts.completed}/{counts.total} tamamlandı, {counts.failed} hata")
+        if batch.status in BATCH_FINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+def read_batch_results(client, batch):
+    """
+    Batch çıktı (ve hata) dosyalarını {custom_id: qa_pair veya None} olarak okur.
+    """
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            qa_pair = None
+            if response.get("status_code") == 200:
+                try:
+                    qa_pair = json.loads(response["body"]["choices"][0]["message"]["content"])
+                except (KeyError, IndexError, TypeError, ValueError) as e:
+                    print(f" Hata ({item.get('custom_id')}): {e}")
+            results[item["custom_id"]] = qa_pair
+    return results
+
+def run_batch(pending, paths, local=False):
+    if local:
+        client, poll_interval = LocalBatchClient(BATCH_LOCAL_DIR), 0
+    else:
+        client, poll_interval = OpenAI(api_key=API_KEY, base_url=BASE_URL), BATCH_POLL_INTERVAL
+
+    if os.path.exists(paths.batch_state):
+        # Yarım kalmış batch varsa yenisini göndermeden onu topla
+        with open(paths.batch_state, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        print(f"📦 Bekleyen batch bulundu: {state['batch_id']}")
+    elif pending:
+        state = submit_batch(client, pending, paths)
+    else:
+        return 0
+
+    batch = wait_for_batch(client, state["batch_id"], poll_interval)
+    results = read_batch_results(client, batch)
+
+    # İstek sırasıyla yaz; sonucu gelmeyenler "failed" olur ve bir sonraki çalıştırmada tekrar denenir
+    with ResultWriter(paths.output, paths.checkpoint) as writer:
+        for request in state["requests"]:
+            writer.record(request["hash"], results.get(request["custom_id"]), request["metadata"])
+
+    os.remove(paths.batch_state)
+    print(f"📦 Batch {batch.status}: {len(results)}/{len(state['requests'])} sonuç alındı")
+    return writer.successful
+
+def output_paths(mode):
+    """
+    Moda göre çıktı, checkpoint ve batch durum dosyaları.
+    batch-local'in ürettiği taklit veri gerçek eğitim setine ve checkpoint'e karışmaz;
+    aksi halde gerçek bir çalıştırma bu chunk'ları bitmiş sayıp hiç API çağrısı yapmazdı.
+    """
+    files = SimpleNamespace(output=OUTPUT_FILE, checkpoint=CHECKPOINT_FILE,
+                            batch_requests=BATCH_REQUESTS_FILE, batch_state=BATCH_STATE_FILE)
+    if mode == "batch-local":
+        os.makedirs(BATCH_LOCAL_DIR, exist_ok=True)
+        files = SimpleNamespace(**{name: os.path.join(BATCH_LOCAL_DIR, os.path.basename(path))
+                                   for name, path in vars(files).items()})
+    return files
 
 def main():
-    print(f"--- TAM KAPASİTE VERİ ÜRETİMİ BAŞLIYOR ({MODEL_NAME}) ---\n")
-    
+    print(f"--- TAM KAPASİTE VERİ ÜRETİMİ BAŞLIYOR ({MODEL_NAME}, mod: {GENERATION_MODE}) ---\n")
+
     # 1. Dosyayı Oku
     if not os.path.exists(INPUT_FILE):
         print(f"HATA: '{INPUT_FILE}' bulunamadı.")
@@ -83,40 +654,25 @@ def main():
         chunks_to_process = all_chunks
     else:
         chunks_to_process = all_chunks[:PROCESS_LIMIT]
-    
+
     total_count = len(chunks_to_process)
-    print(f"Hedef Parça Sayısı: {total_count}")
-    
+    print(f"Hedef Parça Sayısı: {total_count} (Eşzamanlı istek: {MAX_CONCURRENCY})")
+    paths = output_paths(GENERATION_MODE)
+    pending = select_pending(chunks_to_process, paths.checkpoint)
+
     # 2. İşlem Döngüsü
-    successful_generations = 0
-    
-    # 'a' (append) modu ile açıyoruz, elektrik kesilirse kaldığı yerden devam eder.
-    with open(OUTPUT_FILE, "a", encoding="utf-8") as f_out:
-        
-        for i, chunk in tqdm(enumerate(chunks_to_process), total=total_count, unit="parça"):
-            
-            text_content = chunk.get("content", "")
-            
-            # Çok kısa metinleri atla (Gürültü veya başlık olabilir)
-            if len(text_content) < 150:
-                continue
-                
-            # OpenAI Çağrısı
-            qa_pair = generate_synthetic_data(text_content)
-            
-            if qa_pair and "instruction" in qa_pair and "output" in qa_pair:
-                # JSONL satırı olarak yaz
-                f_out.write(json.dumps(qa_pair, ensure_ascii=False) + "\n")
-                f_out.flush() # Her satırda diske yazmayı garantile
-                successful_generations += 1
-            
-            # Çok hızlı gidip rate-limit yememek için minik bir bekleme
-            # gpt-4o-mini çok hızlıdır, bu bekleme güvenli tarafta kalmak içindir.
-            time.sleep(0.2) 
+    start_time = time.perf_counter()
+    if GENERATION_MODE in ("batch", "batch-local"):
+        # Batch API: hepsini gönder, tamamlanınca topla
+        successful_generations = run_batch(pending, paths, local=GENERATION_MODE == "batch-local")
+    else:
+        # asyncio, sınırlı eşzamanlılık + rate limit
+        successful_generations = asyncio.run(run(pending, paths))
 
     print(f"\n--- İŞLEM BİTTİ ---")
     print(f"Toplam Başarılı Veri: {successful_generations}")
-    print(f"Dosya: {OUTPUT_FILE}")
+    print(f"Süre: {time.perf_counter() - start_time:.1f} sn")
+    print(f"Dosya: {paths.output}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
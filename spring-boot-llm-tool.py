@@ -5,66 +5,413 @@ print("⏳ Kütüphaneler kuruluyor... (Bu işlem 1-2 dakika sürebilir)")
 !pip install "unsloth[colab-new] @ git+https://github.com/unslothai/unsloth.git" -q
 !pip install --no-deps xformers trl peft accelerate bitsandbytes -q
 !pip install langchain langchain-community faiss-cpu sentence-transformers -q
-!pip install flask pyngrok flask-cors -q
+!pip install flask pyngrok flask-cors ijson uvicorn starlette -q
 !pip install langchain-huggingface -q
 
 import os
 import json
-import torch
+import time
+import hashlib
 from flask import Flask, request, jsonify
 from pyngrok import ngrok
 from flask_cors import CORS
 
-# RAG ve Model Kütüphaneleri
+# RAG Kütüphaneleri (torch/CUDA başlatmaz; model kütüphaneleri Hücre 2'de yüklenir)
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
-from unsloth import FastLanguageModel
-from trl import SFTTrainer
-from transformers import TrainingArguments
-from datasets import Dataset
 
 print("✅ Kurulum tamamlandı. Sonraki hücreye geçebilirsiniz.")
 
 # ==============================================================================
-# HÜCRE 2: MODEL YÜKLEME VE AYARLAR
+# RAG DATA CLEANER & OPTIMIZER (VERİ TEMİZLEME ROBOTU)
 # ==============================================================================
+import os
+import json
+import re
+import glob
+import itertools
+import multiprocessing
+import pickle
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import ijson
 
-# --- AYARLAR ---
-NGROK_AUTH_TOKEN = "SECRET-TOKEN"
-NGROK_STATIC_DOMAIN = "SECRET-URL"
-MODEL_NAME = "unsloth/Meta-Llama-3.1-8B-Instruct-bnb-4bit"
-MAX_SEQ_LENGTH = 2048
+# Dosya isimleri
+# Birden fazla kılavuz (Boot, Framework, Security...) için her PDF'in LlamaParse çıktısını "*_llamaparse.json" adıyla yükleyin
+input_files = sorted(glob.glob("*_llamaparse.json")) or ["spring_boot_rag_llamaparse.json"]
+output_file = "spring_boot_rag_OPTIMIZED.jsonl"   # Her satır bir chunk (JSONL)
+
+# --- PARALEL TEMİZLEME ---
+# Dokümanlar üst düzey bölüm (Chapter) başlarından parçalara (shard) bölünüp süreç havuzuna dağıtılır;
+# tek bir kılavuz da birden fazla çekirdek kullanır. 1 = her şey tek süreçte, tamamen akışlı çalışır.
+# Havuz "fork" ile açılır (notebook fonksiyonları "spawn" ile alt süreçte import edilemez). Fork ancak
+# torch/CUDA ve tokenizer thread'leri başlamadan güvenlidir: bu hücre Hücre 2'den ÖNCE çalışmalıdır.
+CLEAN_WORKERS = os.cpu_count() or 1
+CLEAN_MAX_IN_FLIGHT = 2 * CLEAN_WORKERS   # Bellekte aynı anda bekleyen en fazla parça
+CLEAN_SHARD_MIN_PAGES = 32                # Parça en az bu kadar sayfa olunca bir sonraki bölüm başında kesilir
 
-# Ngrok Yetkilendirme
-ngrok.set_auth_token(NGROK_AUTH_TOKEN)
+print("🔄 RAG Verisi Optimize Ediliyor...")
 
-print("\n🚀 Model GPU'ya yükleniyor...")
-model, tokenizer = FastLanguageModel.from_pretrained(
-    model_name = MODEL_NAME,
-    max_seq_length = MAX_SEQ_LENGTH,
-    dtype = None,
-    load_in_4bit = True,
-)
+# --- TEMİZLİK KURALLARI (REGEX) ---
+# 1. Versiyon Listeleri (spring-security.version vb.)
+version_pattern = re.compile(r'-\s[\w\-\.]+\.version')
+# 2. İçindekiler Tablosu
+toc_pattern = re.compile(r'Table of Contents', re.IGNORECASE)
+# 3. Yasal Uyarılar / Yazarlar
+legal_pattern = re.compile(r'(Phillip Webb|Dave Syer|Apache License)', re.IGNORECASE)
+
+# Korpus hiçbir zaman tamamen belleğe alınmaz: her aşama bir generator,
+# sayfalar okuma -> filtre -> yapı farkında chunk'lama -> yazma zincirinden akar.
+# Paralel modda bellekte en fazla CLEAN_MAX_IN_FLIGHT parça (birkaç bölüm) bekler.
+stats = {"raw": 0, "written": 0}
+
+def read_chunks(path):
+    # ijson ile JSON dizisini eleman eleman oku (json.load tüm dosyayı belleğe alırdı)
+    with open(path, "rb") as f:
+        for chunk in ijson.items(f, "item", use_float=True):
+            stats["raw"] += 1
+            yield chunk
+
+def filter_noise(chunks):
+    # --- ADIM 1: GÜRÜLTÜ FİLTRESİ ---
+    for chunk in chunks:
+        content = chunk.get("content", "")
+
+        # A) İçindekiler sayfasını atla
+        if toc_pattern.search(content):
+            continue
+
+        # B) Sürüm listelerini (Dependency Versions) temizle
+        if len(version_pattern.findall(content)) > 5: # 5'ten fazla versiyon satırı varsa çöptür
+            continue
+
+        # C) Yazar listesi ve Lisansları atla
+        if legal_pattern.search(content):
+            continue
+
+        # D) Çok kısa (boş) sayfaları atla
+        if len(content) < 50:
+            continue
+
+        yield chunk
+
+# --- ADIM 2: YAPI FARKINDA CHUNK'LAMA ---
+# Sayfa sınırları yerine Markdown başlıkları ve kod blokları (```) esas alınır.
+# all-MiniLM-L6-v2 256 word-piece'ten sonrasını kestiği için hedef bunun altında tutulur.
+CHUNK_TARGET_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 40   # Aynı bölümde bir önceki chunk'ın sonundan taşınan bağlam
+CHUNK_MIN_TOKENS = 60       # Bundan kısa bölümler tek başına chunk olmaz, sonrakiyle birleşir
+CHUNK_MAX_TOKENS = 400      # Kod bloğu ancak bu sınırı aşarsa satır sınırından bölünür (parçalar yeniden ``` ile sarılır)
+
+heading_pattern = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+numbering_pattern = re.compile(r'^(?:Chapter\s+)?(\d+(?:\.\d+)*)\.?\s', re.IGNORECASE)
+chapter_pattern = re.compile(r'^Chapter\s+\d+', re.IGNORECASE)
+fence_pattern = re.compile(r'^\s*(```|~~~)')
+sentence_pattern = re.compile(r'(?<=[.!?])\s+')
+token_pattern = re.compile(r'\w+|([^\w\s])\1*')   # "-----" gibi tekrarlar tek token
+
+def estimate_tokens(text):
+    # Tokenizer yüklemeden kaba tahmin: kelime + noktalama sayısı (BPE sayısına yakın)
+    return sum(1 for _ in token_pattern.finditer(text))
+
+def iter_blocks(chunks):
+    """
+    Dokümanın sayfalarını tek bir Markdown akışı gibi okuyup (tür, metin, sayfa metadata'sı) blokları üretir.
+    Türler: "heading", "code" (``` bloğu; sayfa sınırını aşsa bile bütün kalır) ve "text" (paragraf).
+    """
+    fence, fence_meta = None, None
+    for chunk in chunks:
+        metadata = chunk.get("metadata", {})
+        paragraph = []
+        for line in chunk.get("content", "").split("\n"):
+            if fence is not None:
+                fence.append(line)
+                if fence_pattern.match(line):
+                    yield "code", "\n".join(fence), fence_meta
+                    fence = None
+                continue
+
+            heading = heading_pattern.match(line)
+            if fence_pattern.match(line) or heading or not line.strip():
+                if paragraph:
+                    yield "text", "\n".join(paragraph), metadata
+                    paragraph = []
+                if heading:
+                    yield "heading", line.strip(), metadata
+                elif line.strip():
+                    fence, fence_meta = [line], metadata
+                continue
+            paragraph.append(line)
+
+        # Sayfa sonu paragraf sonu sayılır (kod bloğu hariç)
+        if paragraph:
+            yield "text", "\n".join(paragraph), metadata
+
+    if fence is not None:
+        # Kapanmamış kod bloğu: kapatıp ver
+        yield "code", "\n".join(fence + ["```"]), fence_meta
+
+def parse_heading(line, stack):
+    """
+    Başlık satırını (seviye, başlık, numaralı mı) olarak döndürür.
+    LlamaParse tüm başlıkları "#" ile verir; gerçek derinlik "7.2.3." numarasından okunur.
+    Numarasız başlıklar (ör. "Java", "Maven" sekmeleri) son numaralı başlığın altına yerleşir.
+    """
+    hashes, title = heading_pattern.match(line).groups()
+    numbering = numbering_pattern.match(title)
+    # Kitap "Chapter N." başlıkları kullanıyorsa "3. Optional Locations" gibi tek numaralı başlıklar
+    # aslında numaralı liste maddesidir, yeni bölüm açmaz
+    if numbering and "." not in numbering.group(1) and not chapter_pattern.match(title) \
+            and stack and chapter_pattern.match(stack[0][1]):
+        numbering = None
+    if numbering:
+        return numbering.group(1).count(".") + 1, title, True
+    base = next((level for level, _, numbered in reversed(stack) if numbered), 0)
+    return base + len(hashes), title, False
+
+def split_block(kind, text):
+    """
+    Bloğu (metin, token) parçalarına ayırır. Hedefe sığan blok olduğu gibi kalır; kod blokları
+    CHUNK_MAX_TOKENS'a kadar bölünmez, aşarsa her parça ayrı bir ``` bloğu olur.
+    """
+    tokens = estimate_tokens(text)
+    limit = CHUNK_MAX_TOKENS if kind == "code" else CHUNK_TARGET_TOKENS
+    if tokens <= limit:
+        return [(text, tokens)]
+
+    if kind == "code":
+        lines = text.split("\n")
+        opening, closing = lines[0], "```"
+        units = lines[1:-1] if fence_pattern.match(lines[-1]) else lines[1:]
+        wrap = lambda part: f"{opening}\n{part}\n{closing}"
+        joiner = "\n"
+    else:
+        units = text.split("\n")
+        if len(units) == 1:
+            units = sentence_pattern.split(text)
+        wrap = lambda part: part
+        joiner = "\n" if "\n" in text else " "
+
+    pieces, current, used = [], [], 0
+    for unit in units:
+        cost = estimate_tokens(unit)
+        if current and used + cost > CHUNK_TARGET_TOKENS:
+            pieces.append(joiner.join(current))
+            current, used = [], 0
+        current.append(unit)
+        used += cost
+    if current:
+        pieces.append(joiner.join(current))
+    return [(wrap(piece), estimate_tokens(wrap(piece))) for piece in pieces]
+
+def chunk_document(chunks):
+    """
+    Bir dokümanın sayfalarını başlık yapısına göre, hedef token boyutunda ve örtüşmeli chunk'lara böler.
+    Bölüm yolu metne "CONTEXT:" diye eklenmez, metadata'da "section" olarak taşınır.
+    """
+    stack = []    # (seviye, başlık, numaralı mı)
+    blocks = []   # (metin, token, bölüm yolu, sayfa metadata'sı)
+
+    def emit():
+        # Chunk'ın bölümü, içindeki blokların ortak üst bölümüdür
+        path = blocks[0][2]
+        for _, _, block_path, _ in blocks[1:]:
+            common = 0
+            while common < min(len(path), len(block_path)) and path[common] == block_path[common]:
+                common += 1
+            path = path[:common]
+        metadata = blocks[0][3]
+        return {
+            "content": "\n\n".join(text for text, _, _, _ in blocks),
+            "metadata": {
+                "source": metadata.get("source"),
+                "page_label": metadata.get("page_label"),
+                "section": " > ".join(path),
+            },
+        }
+
+    def overlap_tail():
+        # Bir sonraki chunk'a taşınacak son bloklar (kod blokları hariç)
+        tail, used = [], 0
+        for block in reversed(blocks):
+            if block[0].lstrip().startswith(("```", "~~~")) or used + block[1] > CHUNK_OVERLAP_TOKENS:
+                break
+            tail.insert(0, block)
+            used += block[1]
+        return tail
+
+    for kind, text, metadata in iter_blocks(chunks):
+        if kind == "heading":
+            heading = parse_heading(text, stack)
+            stack = [h for h in stack if h[0] < heading[0]] + [heading]
+            # Yeni bölüm yeni chunk başlatır (önceki chunk çok kısa değilse; örtüşme taşınmaz).
+            # Üst düzey bölüm her zaman yeni chunk açar: paralel temizlemede parçalar buradan kesildiği için
+            # çıktı süreç sayısından bağımsız kalır
+            top_level = heading[0] == 1 and heading[2]
+            if blocks and (top_level or sum(block[1] for block in blocks) >= CHUNK_MIN_TOKENS):
+                yield emit()
+                blocks = []
+
+        path = [title for _, title, _ in stack]
+        for piece, tokens in split_block(kind, text):
+            size = sum(block[1] for block in blocks)
+            # Çok kısa chunk (ör. sadece başlık) kapatılmaz, hedefi biraz aşsa da sonraki blokla birleşir
+            if size >= CHUNK_MIN_TOKENS and size + tokens > CHUNK_TARGET_TOKENS:
+                yield emit()
+                blocks = overlap_tail()
+                while blocks and sum(block[1] for block in blocks) + tokens > CHUNK_TARGET_TOKENS:
+                    blocks.pop(0)
+            blocks.append((piece, tokens, path, metadata))
+
+    if blocks:
+        yield emit()
+
+def read_documents(paths):
+    # Doküman = aynı dosyada, aynı "source" etiketli ardışık sayfalar (gürültüsü filtrelenmiş, generator olarak).
+    # Bölüm takibi ve kısa parça birleştirme doküman içinde kalır.
+    for path in paths:
+        for _, document in itertools.groupby(read_chunks(path), key=lambda c: c.get("metadata", {}).get("source")):
+            yield filter_noise(document)
+
+def is_chapter_start(line, uses_chapters):
+    # Üst düzey bölüm başlığı: "Chapter 7. ..." ya da kitap "Chapter" kullanmıyorsa "7. ..."
+    heading = heading_pattern.match(line)
+    if not heading:
+        return False
+    title = heading.group(2)
+    if chapter_pattern.match(title):
+        return True
+    numbering = numbering_pattern.match(title)
+    return not uses_chapters and numbering is not None and "." not in numbering.group(1)
+
+def shard_document(pages, min_pages):
+    """
+    Dokümanı, üst düzey bölüm başlığıyla başlayan sayfalardan sınırlı boyutlu sayfa listelerine böler.
+    Bölüm başında başlık yığını zaten sıfırlandığı için her parça bağımsız chunk'lanabilir;
+    sadece açık kod bloğu içinden kesilmez.
+    """
+    shard, in_fence, uses_chapters = [], False, False
+    for page in pages:
+        lines = page.get("content", "").split("\n")
+        first = next((line.strip() for line in lines if line.strip()), "")
+        if len(shard) >= min_pages and not in_fence and is_chapter_start(first, uses_chapters):
+            yield shard
+            shard = []
+        shard.append(page)
+        for line in lines:
+            if fence_pattern.match(line):
+                in_fence = not in_fence
+            elif not in_fence:
+                heading = heading_pattern.match(line)
+                uses_chapters = uses_chapters or bool(heading and chapter_pattern.match(heading.group(2)))
+    if shard:
+        yield shard
+
+def clean_shard(pages):
+    return list(chunk_document(pages))
+
+def clean_documents(documents, workers, max_in_flight):
+    """
+    Temizlenmiş chunk'ları giriş sırasıyla üretir (deterministik çıktı).
+    Tek süreçte sayfalar baştan sona akar, hiçbir doküman listeye alınmaz; paralel modda
+    sadece bölüm sınırından kesilmiş, sınırlı boyutlu parçalar bellekte bekler.
+    """
+    try:
+        pickle.dumps(clean_shard)  # Alt süreçlere gönderilebilir mi? (notebook dışı exec ortamları)
+    except (pickle.PicklingError, AttributeError):
+        workers = 1
+    # Model yüklendikten sonra (hücre sonradan tekrar çalıştırıldı) çok thread'li / CUDA'lı süreç fork edilmez:
+    # alt süreçler yarıda kalmış kilitlerde takılabilir
+    if workers > 1 and any(name in sys.modules for name in ("torch", "tokenizers")):
+        print("⚠️ torch/tokenizers yüklü, fork güvenli değil: temizlik tek süreçte yapılıyor.")
+        workers = 1
+
+    if workers <= 1:
+        for pages in documents:
+            yield from chunk_document(pages)
+        return
+
+    # fork: notebook'ta tanımlı regex'ler ve fonksiyonlar alt süreçlerde hazır olur
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        in_flight = deque()
+        for pages in documents:
+            for shard in shard_document(pages, CLEAN_SHARD_MIN_PAGES):
+                in_flight.append(pool.submit(clean_shard, shard))
+                # Okuma, temizlemeden çok öne geçmesin (bellek sınırı)
+                if len(in_flight) >= max_in_flight:
+                    yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+try:
+    cleaned_chunks = clean_documents(read_documents(input_files), CLEAN_WORKERS, CLEAN_MAX_IN_FLIGHT)
+
+    # Dosyayı satır satır kaydet; yarım kalırsa eski çıktı bozulmasın diye önce geçici dosyaya yaz
+    with open(output_file + ".tmp", "w", encoding="utf-8") as f:
+        for new_chunk in cleaned_chunks:
+            f.write(json.dumps(new_chunk, ensure_ascii=False) + "\n")
+            stats["written"] += 1
+    os.replace(output_file + ".tmp", output_file)
+
+    print(f"✅ İŞLEM TAMAMLANDI!")
+    print(f"   - Girdi Dosyaları: {', '.join(input_files)} ({CLEAN_WORKERS} süreç)")
+    print(f"   - Ham Parça Sayısı: {stats['raw']}")
+    print(f"   - Temizlenmiş Parça: {stats['written']}")
+    print(f"   - Yeni Dosya: {output_file}")
+    print(f"👉 HÜCRE 4 bu dosyayı ('{output_file}') otomatik olarak okur.")
+except FileNotFoundError:
+    print("❌ HATA: JSON dosyası bulunamadı! Lütfen dosya adını kontrol et.")
 
-# LoRA Adaptörlerini ekle
-model = FastLanguageModel.get_peft_model(
-    model,
-    r = 16,
-    target_modules = ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
-    lora_alpha = 16,
-    lora_dropout = 0,
-    bias = "none",
-    use_gradient_checkpointing = "unsloth",
-    random_state = 3407,
-)
 
-print("✅ Model Yüklendi ve Hazır.")
 
 # ==============================================================================
-# HÜCRE 3: FINE-TUNING (EĞİTİM)
+# HÜCRE 2: MODEL YÜKLEME VE AYARLAR
 # ==============================================================================
 
+# Model kütüphaneleri burada yüklenir: unsloth import'u CUDA'yı başlatır, bundan sonra süreç fork edilemez
+# (veri temizleyici bu yüzden bu hücreden önce çalışır)
+import torch
+from langchain_huggingface import HuggingFaceEmbeddings
+from unsloth import FastLanguageModel
+from trl import SFTTrainer
+from transformers import TrainingArguments
+from datasets import Dataset
+
+# --- AYARLAR ---
+NGROK_AUTH_TOKEN = "SECRET-TOKEN"
+NGROK_STATIC_DOMAIN = "SECRET-URL"
+MODEL_NAME = "unsloth/Meta-Llama-3.1-8B-Instruct-bnb-4bit"
+MAX_SEQ_LENGTH = 2048
+
+# --- EĞİTİM AYARLARI (Hücre 3 kullanır, parmak izine girer) ---
+FINETUNE_DATA_FILE = "spring_boot_finetune_full.jsonl"
+ADAPTER_DIR = "lora_adapter"              # Eğitilmiş LoRA adaptörü + tokenizer + parmak izi
+MERGED_MODEL_DIR = "lora_merged_16bit"    # ADAPTER_SAVE_MERGED açıksa adaptörün base ağırlıklara gömülmüş hali
+ADAPTER_SAVE_MERGED = False               # Birleştirilmiş model ~16 GB yer kaplar; sunumda adaptör katmanı ek yük getirmez
+FINETUNE_BATCHING = "bucket"              # "pad" | "bucket" | "packing" (Hücre 3'teki açıklamaya bakın)
+FINETUNE_FINGERPRINT_FILE = os.path.join(ADAPTER_DIR, "finetune_fingerprint.json")
+
+LORA_CONFIG = {
+    "r": 16,
+    "target_modules": ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"],
+    "lora_alpha": 16,
+    "lora_dropout": 0,
+    "bias": "none",
+    "random_state": 3407,
+}
+TRAINING_HPARAMS = {
+    "per_device_train_batch_size": 2,
+    "gradient_accumulation_steps": 4,
+    "warmup_steps": 5,
+    "max_steps": 400,
+    "learning_rate": 2e-4,
+    "optim": "adamw_8bit",
+    "weight_decay": 0.01,
+    "lr_scheduler_type": "linear",
+    "seed": 3407,
+}
+
 # Prompt Formatı
 alpaca_prompt = """<|begin_of_text|><|start_header_id|>system<|end_header_id|>
 
@@ -74,6 +421,81 @@ Sen bir Spring Boot ve Java uzmanısın. Kullanıcının teknik sorularına, dok
 
 {}<|eot_id|>"""
 
+def compute_finetune_fingerprint():
+    # Parmak izi = eğitim verisi + prompt şablonu + model/LoRA/eğitim ayarları.
+    # Kayıtlı adaptörünkiyle aynıysa eğitim atlanır, model doğrudan diskten yüklenir.
+    h = hashlib.sha256()
+    try:
+        with open(FINETUNE_DATA_FILE, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    except FileNotFoundError:
+        return None
+    settings = {
+        "model": MODEL_NAME,
+        "max_seq_length": MAX_SEQ_LENGTH,
+        "prompt": alpaca_prompt,
+        "lora": LORA_CONFIG,
+        "training": TRAINING_HPARAMS,
+        "batching": FINETUNE_BATCHING,
+    }
+    h.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def read_saved_fingerprint():
+    try:
+        with open(FINETUNE_FINGERPRINT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+# Ngrok Yetkilendirme
+ngrok.set_auth_token(NGROK_AUTH_TOKEN)
+
+# --- EĞİT BİR KEZ, SUN ÇOK KEZ ---
+# Parmak izi değişmemişse kayıtlı adaptör (ya da birleştirilmiş model) yüklenir ve Hücre 3 eğitimi atlar.
+# Eğitim verisi bu makinede yoksa diskteki adaptör olduğu gibi kullanılır.
+start_time = time.perf_counter()
+finetune_fingerprint = compute_finetune_fingerprint()
+saved_fingerprint = read_saved_fingerprint()
+FINETUNE_REQUIRED = not (
+    saved_fingerprint and (finetune_fingerprint is None or saved_fingerprint["fingerprint"] == finetune_fingerprint)
+)
+
+if FINETUNE_REQUIRED:
+    print("\n🚀 Model GPU'ya yükleniyor...")
+    model, tokenizer = FastLanguageModel.from_pretrained(
+        model_name = MODEL_NAME,
+        max_seq_length = MAX_SEQ_LENGTH,
+        dtype = None,
+        load_in_4bit = True,
+    )
+
+    # LoRA Adaptörlerini ekle
+    model = FastLanguageModel.get_peft_model(
+        model,
+        **LORA_CONFIG,
+        use_gradient_checkpointing = "unsloth",
+    )
+else:
+    use_merged = saved_fingerprint.get("merged") and os.path.isdir(MERGED_MODEL_DIR)
+    saved_model_dir = MERGED_MODEL_DIR if use_merged else ADAPTER_DIR
+    print(f"\n🚀 Eğitilmiş model diskten yükleniyor: {saved_model_dir} ({saved_fingerprint['fingerprint']})")
+    model, tokenizer = FastLanguageModel.from_pretrained(
+        model_name = saved_model_dir,
+        max_seq_length = MAX_SEQ_LENGTH,
+        dtype = None,
+        load_in_4bit = True,
+    )
+
+print(f"✅ Model Yüklendi ve Hazır. ({time.perf_counter() - start_time:.1f} sn)")
+
+# ==============================================================================
+# HÜCRE 3: FINE-TUNING (EĞİTİM)
+# ==============================================================================
+import shutil
+import numpy as np
+
 # Veri Temizleme Fonksiyonu
 def load_and_sanitize_data(file_path):
     safe_data = []
@@ -105,40 +527,218 @@ def formatting_prompts_func(examples):
         texts.append(alpaca_prompt.format(instruction, output) + tokenizer.eos_token)
     return { "text" : texts, }
 
+# --- TOKEN ÖNBELLEĞİ (Pre-tokenized Dataset Cache) ---
+# Örnekler bir kez tokenize edilir: tüm token'lar tek bir düz dizi (tokens.npy) + örnek sınırları
+# (offsets.npy) olarak yazılır, sonraki çalıştırmalarda memory-map ile okunur.
+# Anahtar = veri dosyası + prompt şablonu + tokenizer; biri değişirse önbellek yeniden kurulur.
+FINETUNE_CACHE_DIR = "finetune_token_cache"
+FINETUNE_TOKENIZE_BATCH = 1000
+
+def tokenizer_fingerprint(tokenizer):
+    # Fast tokenizer'ın tam tanımı (vocab, merge'ler, BOS ekleyen post-processor) hash'lenir
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    spec = backend.to_str() if backend is not None else json.dumps(tokenizer.get_vocab(), sort_keys=True)
+    h = hashlib.sha256(spec.encode("utf-8"))
+    h.update(json.dumps([tokenizer.bos_token, tokenizer.eos_token, MAX_SEQ_LENGTH]).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def finetune_cache_key():
+    h = hashlib.sha256()
+    with open(FINETUNE_DATA_FILE, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(alpaca_prompt.encode("utf-8"))
+    h.update(tokenizer_fingerprint(tokenizer).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def load_token_cache(cache_key):
+    try:
+        with open(os.path.join(FINETUNE_CACHE_DIR, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None, None
+    if meta.get("cache_key") != cache_key:
+        return None, None
+    tokens = np.load(os.path.join(FINETUNE_CACHE_DIR, "tokens.npy"), mmap_mode="r")
+    offsets = np.load(os.path.join(FINETUNE_CACHE_DIR, "offsets.npy"))
+    print(f"⚡ Token önbelleği diskten açıldı: {len(offsets) - 1} örnek, {len(tokens)} token ({cache_key})")
+    return tokens, offsets
+
+def build_token_cache(dataset, cache_key):
+    # SFTTrainer'ın dataset_text_field ile yaptığı tokenizasyonun aynısı (özel token'lar dahil, MAX_SEQ_LENGTH'te kesilir)
+    texts = dataset.map(formatting_prompts_func, batched = True)["text"]
+    chunks, lengths = [], []
+    for start in range(0, len(texts), FINETUNE_TOKENIZE_BATCH):
+        encoded = tokenizer(texts[start:start + FINETUNE_TOKENIZE_BATCH], truncation=True, max_length=MAX_SEQ_LENGTH)["input_ids"]
+        for ids in encoded:
+            chunks.append(np.asarray(ids, dtype=np.int32))
+            lengths.append(len(ids))
+    tokens = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # Yarım kalan yazım geçerli önbellek sayılmasın diye meta.json en son yazılır
+    tmp_dir = FINETUNE_CACHE_DIR + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, "tokens.npy"), tokens)
+    np.save(os.path.join(tmp_dir, "offsets.npy"), offsets)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"cache_key": cache_key, "examples": len(lengths), "tokens": int(len(tokens))}, f)
+    shutil.rmtree(FINETUNE_CACHE_DIR, ignore_errors=True)
+    os.replace(tmp_dir, FINETUNE_CACHE_DIR)
+    print(f"💾 Token önbelleği yazıldı: {len(lengths)} örnek, {len(tokens)} token ({cache_key})")
+    return load_token_cache(cache_key)
+
+# --- BATCH STRATEJİSİ ---
+# "pad":     Rastgele batch'ler, en uzun örneğe kadar dolgu (eski davranış)
+# "bucket":  Benzer uzunluktaki örnekler aynı batch'e düşer (group_by_length), dolgu çok azalır
+# "packing": Örnekler MAX_SEQ_LENGTH dizilere paketlenir, batch dolgusuz tek satıra düzleştirilir.
+#            position_ids her örnekte sıfırlanır; flash-attention-2 bu sınırları görüp örnekler
+#            arası dikkati engeller. FA2 yoksa (T4) sınırlar korunamayacağı için "bucket"a dönülür.
+class TokenizedExamples(torch.utils.data.Dataset):
+    def __init__(self, tokens, offsets):
+        self.tokens = tokens
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return {"input_ids": self.tokens[self.offsets[i]:self.offsets[i + 1]].tolist()}
+
+class PackedExamples(TokenizedExamples):
+    def __init__(self, tokens, offsets, max_length):
+        super().__init__(tokens, offsets)
+        # First-fit decreasing: uzun örnekler önce yerleşir, kısalar boşlukları doldurur
+        lengths = np.diff(offsets)
+        self.packs, free = [], []
+        for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+            for p, room in enumerate(free):
+                if lengths[i] <= room:
+                    self.packs[p].append(i)
+                    free[p] -= lengths[i]
+                    break
+            else:
+                self.packs.append([i])
+                free.append(max_length - lengths[i])
+
+    def __len__(self):
+        return len(self.packs)
+
+    def __getitem__(self, i):
+        input_ids, position_ids = [], []
+        for j in self.packs[i]:
+            ids = self.tokens[self.offsets[j]:self.offsets[j + 1]].tolist()
+            input_ids += ids
+            position_ids += range(len(ids))
+        return {"input_ids": input_ids, "position_ids": position_ids}
+
+def pad_collator(features):
+    # Sağa dolgu; dolgu token'ları kayba girmez
+    width = max(len(f["input_ids"]) for f in features)
+    input_ids = torch.full((len(features), width), tokenizer.pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(features), width), dtype=torch.long)
+    labels = torch.full((len(features), width), -100, dtype=torch.long)
+    for row, f in enumerate(features):
+        ids = torch.tensor(f["input_ids"], dtype=torch.long)
+        input_ids[row, :len(ids)] = ids
+        attention_mask[row, :len(ids)] = 1
+        labels[row, :len(ids)] = ids
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+def packed_collator(features):
+    # Batch tek satıra düzleştirilir, attention_mask verilmez (FA2 sınırları position_ids'den bulur).
+    # Her örneğin ilk token'ı bir önceki örneğin sonundan tahmin edilmesin diye kayıptan çıkarılır.
+    input_ids = torch.tensor([t for f in features for t in f["input_ids"]], dtype=torch.long)
+    position_ids = torch.tensor([p for f in features for p in f["position_ids"]], dtype=torch.long)
+    labels = input_ids.masked_fill(position_ids == 0, -100)
+    return {"input_ids": input_ids[None], "position_ids": position_ids[None], "labels": labels[None]}
+
+def padding_efficiency(lengths, batch_size, grouped, seed=3407):
+    # Gerçek token / işlenen (dolgulu) token oranı; bucket için LengthGroupedSampler'a benzer mega-batch sıralaması
+    order = np.random.default_rng(seed).permutation(len(lengths))
+    if grouped:
+        mega = batch_size * 50
+        order = np.concatenate([sorted(order[i:i + mega], key=lambda j: -lengths[j]) for i in range(0, len(order), mega)])
+    padded = sum(len(order[i:i + batch_size]) * max(lengths[order[i:i + batch_size]]) for i in range(0, len(order), batch_size))
+    return lengths.sum() / padded
+
+def make_train_dataset(tokens, offsets):
+    # Dönüş: (dataset, collator, group_by_length)
+    batching = FINETUNE_BATCHING
+    if batching == "packing" and getattr(model.config, "_attn_implementation", None) != "flash_attention_2":
+        print("⚠️ Packing örnek sınırlarını korumak için flash-attention-2 ister, 'bucket' kullanılıyor.")
+        batching = "bucket"
+
+    lengths = np.diff(offsets)
+    batch_size = TRAINING_HPARAMS["per_device_train_batch_size"]
+    report = f"rastgele %{100 * padding_efficiency(lengths, batch_size, False):.0f}"
+    if batching == "packing":
+        dataset = PackedExamples(tokens, offsets, MAX_SEQ_LENGTH)
+        fill = lengths.sum() / (len(dataset) * MAX_SEQ_LENGTH)
+        print(f"📦 {len(lengths)} örnek {len(dataset)} pakete yerleşti (doluluk %{100 * fill:.0f}, dolgu yok; {report})")
+        return dataset, packed_collator, False
+    if batching == "bucket":
+        report += f" -> bucket %{100 * padding_efficiency(lengths, batch_size, True):.0f}"
+    print(f"📦 Batch stratejisi: {batching}, gerçek token oranı: {report}")
+    return TokenizedExamples(tokens, offsets), pad_collator, batching == "bucket"
+
+def save_finetuned_model():
+    # Adaptör + tokenizer + parmak izi; parmak izi en son yazılır, yarım kalan kayıt geçerli sayılmaz
+    if os.path.exists(FINETUNE_FINGERPRINT_FILE):
+        os.remove(FINETUNE_FINGERPRINT_FILE)
+    model.save_pretrained(ADAPTER_DIR)
+    tokenizer.save_pretrained(ADAPTER_DIR)
+    if ADAPTER_SAVE_MERGED:
+        model.save_pretrained_merged(MERGED_MODEL_DIR, tokenizer, save_method = "merged_16bit")
+    with open(FINETUNE_FINGERPRINT_FILE, "w", encoding="utf-8") as f:
+        json.dump({
+            "fingerprint": finetune_fingerprint,
+            "merged": ADAPTER_SAVE_MERGED,
+            "base_model": MODEL_NAME,
+            "trained_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }, f, indent=2)
+    print(f"💾 Adaptör kaydedildi: {ADAPTER_DIR}{' + ' + MERGED_MODEL_DIR if ADAPTER_SAVE_MERGED else ''} ({finetune_fingerprint})")
+
 # Eğitimi Başlat
 try:
-    dataset = load_and_sanitize_data("spring_boot_finetune_full.jsonl")
-
-    if dataset:
-        dataset = dataset.map(formatting_prompts_func, batched = True)
+    tokens = offsets = None
+    if FINETUNE_REQUIRED and finetune_fingerprint:
+        cache_key = finetune_cache_key()
+        tokens, offsets = load_token_cache(cache_key)
+        if tokens is None:
+            dataset = load_and_sanitize_data(FINETUNE_DATA_FILE)
+            if dataset:
+                tokens, offsets = build_token_cache(dataset, cache_key)
+
+    if not FINETUNE_REQUIRED:
+        print("⏭️ Eğitim verisi ve ayarlar değişmemiş, kayıtlı adaptör kullanılıyor. Eğitim atlandı.")
+    elif tokens is not None and len(offsets) > 1:
+        train_dataset, data_collator, group_by_length = make_train_dataset(tokens, offsets)
 
         print("🧠 Eğitim Başlıyor...")
+        # Veri önceden tokenize edildi: SFTTrainer'ın kendi hazırlık adımı atlanır
         trainer = SFTTrainer(
             model = model,
             tokenizer = tokenizer,
-            train_dataset = dataset,
-            dataset_text_field = "text",
+            train_dataset = train_dataset,
+            data_collator = data_collator,
             max_seq_length = MAX_SEQ_LENGTH,
-            dataset_num_proc = 2,
-            packing = False,
+            dataset_kwargs = {"skip_prepare_dataset": True},
             args = TrainingArguments(
-                per_device_train_batch_size = 2,
-                gradient_accumulation_steps = 4,
-                warmup_steps = 5,
-                max_steps = 400,
-                learning_rate = 2e-4,
+                **TRAINING_HPARAMS,
+                group_by_length = group_by_length,
+                remove_unused_columns = False,
                 fp16 = not torch.cuda.is_bf16_supported(),
                 bf16 = torch.cuda.is_bf16_supported(),
                 logging_steps = 1,
-                optim = "adamw_8bit",
-                weight_decay = 0.01,
-                lr_scheduler_type = "linear",
-                seed = 3407,
                 output_dir = "outputs",
             ),
         )
         trainer.train()
         print("✅ Fine-Tuning Tamamlandı! Model hafızada güncellendi.")
+        save_finetuned_model()
     else:
         print("⚠️ Veri seti yok, Base Model ile devam ediliyor.")
 
@@ -146,127 +746,236 @@ except Exception as e:
     print(f"⚠️ Eğitim Hatası: {e}")
 
 
-# ==============================================================================
-# RAG DATA CLEANER & OPTIMIZER (VERİ TEMİZLEME ROBOTU)
-# ==============================================================================
-import json
-import re
-
-# Dosya isimleri
-input_file = "spring_boot_rag_llamaparse.json"
-output_file = "spring_boot_rag_OPTIMIZED.json"
-
-print("🔄 RAG Verisi Optimize Ediliyor...")
-
-try:
-    with open(input_file, "r", encoding="utf-8") as f:
-        raw_data = json.load(f)
-except FileNotFoundError:
-    print("❌ HATA: JSON dosyası bulunamadı! Lütfen dosya adını kontrol et.")
-    raw_data = []
-
-cleaned_data = []
-current_chapter = "General"
-buffer_text = ""
-
-# --- TEMİZLİK KURALLARI (REGEX) ---
-# 1. Versiyon Listeleri (spring-security.version vb.)
-version_pattern = re.compile(r'-\s[\w\-\.]+\.version')
-# 2. İçindekiler Tablosu
-toc_pattern = re.compile(r'Table of Contents', re.IGNORECASE)
-# 3. Yasal Uyarılar / Yazarlar
-legal_pattern = re.compile(r'(Phillip Webb|Dave Syer|Apache License)', re.IGNORECASE)
-
-total_chunks = len(raw_data)
-kept_chunks = 0
-
-for chunk in raw_data:
-    content = chunk.get("content", "")
-
-    # --- ADIM 1: GÜRÜLTÜ FİLTRESİ ---
-
-    # A) İçindekiler sayfasını atla
-    if toc_pattern.search(content):
-        continue
-
-    # B) Sürüm listelerini (Dependency Versions) temizle
-    if len(version_pattern.findall(content)) > 5: # 5'ten fazla versiyon satırı varsa çöptür
-        continue
-
-    # C) Yazar listesi ve Lisansları atla
-    if legal_pattern.search(content):
-        continue
-
-    # D) Çok kısa (boş) sayfaları atla
-    if len(content) < 50:
-        continue
-
-    # --- ADIM 2: BAĞLAM YAKALAMA (Context Injection) ---
-    # Eğer satır "# Chapter" ile başlıyorsa, o başlığı hafızaya al
-    lines = content.split('\n')
-    for line in lines[:3]:
-        if line.strip().startswith("# ") and len(line) < 100:
-            current_chapter = line.strip().replace("#", "").strip()
-            break
-
-    # --- ADIM 3: ZENGİNLEŞTİRME ---
-    # Her parçanın başına "Bu parça şu bölümden geliyor" diye etiket yapıştırıyoruz.
-    # Böylece model "Service" ararken "Giriş" bölümündeki kodla karıştıramaz.
-    enriched_content = f"CONTEXT: Spring Boot Reference - Section: {current_chapter}\n\n{content}"
-
-    # --- ADIM 4: BİRLEŞTİRME (Merging) ---
-    # 300 karakterden kısa parçaları tek başına alma, bir sonrakine ekle (Buffer)
-    if len(content) < 300:
-        buffer_text += "\n\n" + enriched_content
-        continue
-    else:
-        if buffer_text:
-            enriched_content = buffer_text + "\n\n" + enriched_content
-            buffer_text = ""
-
-    # Temizlenmiş veriyi kaydet
-    new_chunk = {
-        "content": enriched_content,
-        "metadata": chunk.get("metadata", {})
-    }
-    cleaned_data.append(new_chunk)
-    kept_chunks += 1
-
-# Kalan buffer'ı ekle
-if buffer_text:
-    cleaned_data.append({"content": buffer_text, "metadata": {"source": "merged"}})
-
-# Dosyayı Kaydet
-with open(output_file, "w", encoding="utf-8") as f:
-    json.dump(cleaned_data, f, ensure_ascii=False, indent=2)
-
-print(f"✅ İŞLEM TAMAMLANDI!")
-print(f"   - Ham Parça Sayısı: {total_chunks}")
-print(f"   - Temizlenmiş Parça: {len(cleaned_data)}")
-print(f"   - Yeni Dosya: {output_file}")
-print("👉 Şimdi HÜCRE 4'teki kodda dosya adını 'spring_boot_rag_OPTIMIZED.json' olarak değiştir.")
-
-
-
 # ==============================================================================
 # HÜCRE 4: RAG SİSTEMİ (Vektör Veritabanı)
 # ==============================================================================
 print("\n📚 RAG Sistemi Kuruluyor...")
 
-try:
-    with open("spring_boot_rag_OPTIMIZED.json", "r", encoding="utf-8") as f:
-        rag_data = json.load(f)
-
-    # Gürültü Filtresi
-    BLACKLIST_KEYWORDS = [
-        "Table of Contents", "Phillip Webb", "1. Legal", "2. Getting Help",
-        "Documentation Overview", "Upgrading From an Earlier Version"
-    ]
+import hashlib
+import re
+import shutil
+import time
+import queue
+import threading
+from threading import Thread
+from collections import Counter, OrderedDict
+import numpy as np
+import faiss
+import torch
+from langchain_core.embeddings import Embeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+RAG_SOURCE_FILE = "spring_boot_rag_OPTIMIZED.jsonl"   # Temizleyici hücresinin JSONL çıktısı
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+INDEX_STORE_DIR = "rag_index_store"   # FAISS index + embedding matrisi + chunk metinleri + manifest
+
+# --- INDEX TÜRÜ ---
+# "flat":     Birebir (exact) arama, vektör başına 384 x float32 = 1536 bayt
+# "ivfpq":    IVF kümeleri + Product Quantization, vektör başına PQ_M bayt (eğitim gerekir)
+# "hnsw_sq8": HNSW grafı + int8 scalar quantization, vektör başına 384 bayt + graf
+INDEX_BACKEND = "flat"
+IVF_NLIST = 0                 # 0 = otomatik (~4·√N)
+IVF_NPROBE = 16               # Aramada taranan küme sayısı (recall <-> hız)
+PQ_M = 48                     # 384 boyut / 48 = alt vektör başına 8 boyut
+PQ_NBITS = 8
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64           # Aramada gezilen aday sayısı (recall <-> hız)
+INDEX_RETRAIN_GROWTH = 2.0    # IVF-PQ: korpus eğitimdekinin bu katına çıkınca yeniden eğit
+INDEX_MMAP = True             # index.faiss RAM'e kopyalanmadan memory-map edilir; aynı dosyayı açan süreçler sayfaları paylaşır
+INDEX_REPORT = True           # Sıkıştırılmış index kurulunca flat'e karşı recall/latency raporu yazdır
+INDEX_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# --- EMBEDDING SERVİSİ ---
+# Index kurulumu (toplu) ve sorgular (tekil, eşzamanlı) aynı embedding bileşenini kullanır.
+# "onnx" backend'i MiniLM'in int8 quantize ONNX sürümünü CPU'da çalıştırır; GPU tamamen
+# üretim modeline kalır (gerekli paket: sentence-transformers[onnx]).
+EMBED_BACKEND = "hf"                # "hf": sentence-transformers (torch) | "onnx": int8 ONNX, CPU
+EMBED_ONNX_FILE = "onnx/model_qint8_avx512_vnni.onnx"   # AVX2 işlemciler için: onnx/model_quint8_avx2.onnx
+EMBED_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+EMBED_BATCH_SIZE = 64               # Toplu embedding batch boyutu
+EMBED_AUTOTUNE = True               # İlk büyük işte aday boyutlar ölçülür, en hızlısı kullanılır
+EMBED_AUTOTUNE_CANDIDATES = (16, 32, 64, 128, 256)
+EMBED_AUTOTUNE_SAMPLE = 256
+EMBED_QUERY_CACHE_SIZE = 1024       # Son sorgu vektörleri (LRU)
+EMBED_QUERY_MAX_BATCH = 32          # Aynı anda gelen sorgular tek forward'da embed edilir
+EMBED_QUERY_MAX_WAIT_MS = 2         # İlk sorgudan sonra batch'e katılacak diğerleri için bekleme
+
+class EmbeddingService(Embeddings):
+    """
+    Ortak embedding bileşeni:
+    - embed_documents: ölçülerek seçilen batch boyutuyla toplu embedding
+    - embed_query: LRU önbellek + eşzamanlı sorguları toplayan mikro-batch worker'ı
+    """
+    def __init__(self, model_name, backend="hf", device="cpu", onnx_file=None, batch_size=64,
+                 autotune=False, cache_size=1024, max_batch=32, max_wait_ms=2):
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.batch_size = batch_size
+        self.autotune = autotune
+        self.model = self._load_model(device)
+        self.model_lock = threading.Lock()   # Toplu iş ve sorgu worker'ı modeli sırayla kullanır
+
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.worker = None
+        self.counters = {"query_hits": 0, "query_misses": 0, "query_batches": 0, "batched_queries": 0, "documents": 0}
+
+    def _load_model(self, device):
+        if self.backend == "onnx":
+            try:
+                return HuggingFaceEmbeddings(
+                    model_name=self.model_name,
+                    model_kwargs={"device": "cpu", "backend": "onnx", "model_kwargs": {"file_name": self.onnx_file}},
+                    encode_kwargs={"batch_size": self.batch_size},
+                )
+            except Exception as e:
+                print(f"⚠️ ONNX embedding yüklenemedi, torch backend'e dönülüyor: {e}")
+                self.backend = "hf"
+        return HuggingFaceEmbeddings(model_name=self.model_name, model_kwargs={"device": device},
+                                     encode_kwargs={"batch_size": self.batch_size})
+
+    @property
+    def model_key(self):
+        # Manifest'e yazılır: ONNX int8 vektörleri torch'unkinden biraz farklıdır, index yeniden kurulur
+        if self.backend == "onnx":
+            return f"{self.model_name}+onnx:{self.onnx_file}"
+        return self.model_name
+
+    def _encode(self, texts, batch_size):
+        with self.model_lock:
+            self.model.encode_kwargs["batch_size"] = batch_size
+            return self.model.embed_documents(texts)
+
+    def _autotune(self, sample):
+        self._encode(sample[:8], 8)   # Isınma (CUDA/ONNX oturumu, ilk çağrı maliyeti)
+        timings, vectors = {}, None
+        for size in EMBED_AUTOTUNE_CANDIDATES:
+            start = time.perf_counter()
+            vectors = self._encode(sample, size)
+            timings[size] = time.perf_counter() - start
+        self.batch_size = min(timings, key=timings.get)
+        report = ", ".join(f"{size}: {len(sample) / t:.0f}/sn" for size, t in timings.items())
+        print(f"🎛️ Embedding batch boyutu {self.batch_size} seçildi ({report})")
+        return vectors
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = []
+        if self.autotune and len(texts) >= 4 * EMBED_AUTOTUNE_SAMPLE:
+            # Ölçüm örneğinin vektörleri boşa gitmez, sonucun başına eklenir
+            self.autotune = False
+            vectors = self._autotune(texts[:EMBED_AUTOTUNE_SAMPLE])
+            texts = texts[EMBED_AUTOTUNE_SAMPLE:]
+        if texts:
+            vectors += self._encode(texts, self.batch_size)
+        self.counters["documents"] += len(vectors)
+        return vectors
+
+    def embed_query(self, text):
+        with self.lock:
+            vector = self.cache.get(text)
+            if vector is not None:
+                self.cache.move_to_end(text)
+                self.counters["query_hits"] += 1
+                return list(vector)
+            self.counters["query_misses"] += 1
+            if self.worker is None:
+                self.worker = Thread(target=self._worker_loop, daemon=True)
+                self.worker.start()
+
+        job = {"text": text, "vector": None, "error": None, "done": threading.Event()}
+        self.requests.put(job)
+        job["done"].wait()
+        if job["error"] is not None:
+            raise job["error"]
+
+        with self.lock:
+            self.cache[text] = job["vector"]
+            self.cache.move_to_end(text)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return list(job["vector"])
+
+    def _worker_loop(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = list(dict.fromkeys(job["text"] for job in batch))   # Aynı sorgu bir kez hesaplanır
+            try:
+                vectors = dict(zip(texts, self._encode(texts, len(texts))))
+                for job in batch:
+                    job["vector"] = tuple(vectors[job["text"]])
+            except Exception as e:
+                for job in batch:
+                    job["error"] = e
+            finally:
+                with self.lock:
+                    self.counters["query_batches"] += 1
+                    self.counters["batched_queries"] += len(batch)
+                for job in batch:
+                    job["done"].set()
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            cached = len(self.cache)
+        lookups = counters["query_hits"] + counters["query_misses"]
+        return {
+            "model": self.model_key,
+            "batch_size": self.batch_size,
+            "query_cache_entries": cached,
+            "query_hit_rate": round(counters["query_hits"] / lookups, 3) if lookups else 0.0,
+            "avg_query_batch": round(counters["batched_queries"] / counters["query_batches"], 2) if counters["query_batches"] else 0.0,
+            **counters,
+        }
 
+# Gürültü Filtresi
+BLACKLIST_KEYWORDS = [
+    "Table of Contents", "Phillip Webb", "1. Legal", "2. Getting Help",
+    "Documentation Overview", "Upgrading From an Earlier Version"
+]
+
+def compute_corpus_key(file_path):
+    # Anahtar = girdi JSON içeriği + filtre listesi.
+    # Değişmemişse manifest'teki anahtarla eşleşir ve index doğrudan diskten açılır.
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(json.dumps(BLACKLIST_KEYWORDS).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def compute_chunk_hash(doc):
+    payload = doc.page_content + json.dumps(doc.metadata, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def read_jsonl(file_path):
+    # JSONL: her satır bir chunk, dosya satır satır okunur
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def load_rag_documents(file_path):
     documents = []
     skipped_count = 0
 
-    for chunk in rag_data:
+    for chunk in read_jsonl(file_path):
         content = chunk.get("content", "")
         if len(content) < 100: continue
 
@@ -280,28 +989,425 @@ try:
             skipped_count += 1
             continue
 
-        doc = Document(page_content=content, metadata={"source": "Spring Boot Docs"})
+        # Temizleyicinin metadata'sı (source, page_label, section) olduğu gibi taşınır
+        metadata = dict(chunk.get("metadata") or {})
+        metadata["source"] = metadata.get("source") or "Spring Boot Docs"
+        doc = Document(page_content=content, metadata=metadata)
         documents.append(doc)
 
     print(f"🧹 {skipped_count} adet gürültülü parça temizlendi.")
+    return documents
+
+def indexing_text(content, metadata):
+    # Bölüm yolu chunk metnine yazılmaz; sadece embedding ve BM25 için metnin başına eklenir
+    section = metadata.get("section")
+    return f"{section}\n\n{content}" if section else content
+
+def read_manifest(store_path):
+    manifest_path = os.path.join(store_path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_index_store(store_path, records, embeddings, index, manifest):
+    # Önce geçici klasöre yaz, sonra tek hamlede yerine koy (yarım kalan kayıt okunmasın)
+    tmp_path = store_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    matrix = np.lib.format.open_memmap(
+        os.path.join(tmp_path, "embeddings.npy"), mode="w+",
+        dtype=np.float32, shape=embeddings.shape
+    )
+    matrix[:] = embeddings
+    matrix.flush()
+    del matrix
+
+    faiss.write_index(index, os.path.join(tmp_path, "index.faiss"))
+
+    # chunks.jsonl satır sırası = embeddings.npy satır sırası
+    with open(os.path.join(tmp_path, "chunks.jsonl"), "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(store_path, ignore_errors=True)
+    os.replace(tmp_path, store_path)
+
+def index_params():
+    # Manifest'e yazılır; ayarlar değişince index embedding'ler yeniden hesaplanmadan baştan kurulur
+    if INDEX_BACKEND == "ivfpq":
+        return {"backend": "ivfpq", "nlist": IVF_NLIST, "pq_m": PQ_M, "pq_nbits": PQ_NBITS}
+    if INDEX_BACKEND == "hnsw_sq8":
+        return {"backend": "hnsw_sq8", "m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+    return {"backend": "flat"}
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    # Arama ayarları dosyaya bağlı değildir, her yüklemede (mmap'li index'te de) uygulanır
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = nprobe or IVF_NPROBE
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    return index
+
+def build_vector_index(backend, embeddings, ids):
+    """
+    Embedding matrisinden (eğitim + ekleme) sıfırdan index kurar. İd'ler kalıcı chunk id'leridir.
+    """
+    n, dim = embeddings.shape
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    if backend == "ivfpq" and n < 2 ** PQ_NBITS:
+        print(f"⚠️ IVF-PQ eğitimi için en az {2 ** PQ_NBITS} vektör gerekir ({n} var), flat index kullanılıyor.")
+        backend = "flat"
+
+    if backend == "ivfpq":
+        # Her kümeye en az ~39 eğitim vektörü düşsün (faiss k-means önerisi)
+        nlist = IVF_NLIST or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n // 39))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, PQ_M, PQ_NBITS)
+        # Küçük korpuslarda k-means her alt vektör için uyarı basmasın
+        index.cp.min_points_per_centroid = 5
+        index.pq.cp.min_points_per_centroid = 5
+    elif backend == "hnsw_sq8":
+        hnsw = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+    if not index.is_trained:
+        start_time = time.perf_counter()
+        index.train(embeddings)
+        print(f"🏋️ {backend} index'i {n} vektörle eğitildi - {time.perf_counter() - start_time:.2f} sn")
+    if n:
+        index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    return set_search_params(index)
+
+def index_quality_report(index, embeddings, ids, k=10, sample=200):
+    """
+    Index'i birebir (flat) aramaya karşı ölçer: recall@k, sorgu başına gecikme ve boyut.
+    Sorgu olarak korpustaki vektörlerden rastgele bir örnek kullanılır.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    rng = np.random.default_rng(0)
+    queries = embeddings[rng.choice(len(embeddings), size=min(sample, len(embeddings)), replace=False)]
+
+    exact = faiss.IndexFlatL2(embeddings.shape[1])
+    exact.add(embeddings)
+    _, truth = exact.search(queries, k)
+    truth = ids[truth]
+
+    def measure(target):
+        start_time = time.perf_counter()
+        found = np.vstack([target.search(q[None, :], k)[1] for q in queries])  # Servisteki gibi tek tek sorgu
+        latency_ms = (time.perf_counter() - start_time) * 1000 / len(queries)
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        return recall, latency_ms
+
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(base, faiss.IndexIVF):
+        sweep = [("nprobe", v, {"nprobe": v}) for v in (1, 4, 8, 16, 32, 64) if v <= base.nlist]
+    elif isinstance(base, faiss.IndexHNSW):
+        sweep = [("efSearch", v, {"ef_search": v}) for v in (16, 32, 64, 128, 256)]
+    else:
+        sweep = [("exact", "-", {})]
+
+    rows = [("flat", "exact", "-", 1.0, measure(exact)[1], exact.ntotal * exact.d * 4)]
+    size = faiss.serialize_index(index).nbytes
+    for name, value, params in sweep:
+        set_search_params(index, **params)
+        recall, latency_ms = measure(index)
+        rows.append((type(base).__name__, name, value, recall, latency_ms, size))
+    set_search_params(index)
+
+    print(f"📊 Index raporu (recall@{k}, {len(queries)} sorgu, flat'e göre):")
+    print(f"   {'index':<14}{'ayar':<10}{'değer':>6}{'recall':>9}{'ms/sorgu':>10}{'boyut (MB)':>12}")
+    for kind, name, value, recall, latency_ms, nbytes in rows:
+        print(f"   {kind:<14}{name:<10}{str(value):>6}{recall:>9.3f}{latency_ms:>10.3f}{nbytes / 1e6:>12.2f}")
+    return rows
+
+def load_index_store(store_path, embed_model, mmap=False):
+    # mmap=True: salt okunur, paylaşılabilir; güncellenecek index normal (kopyalanarak) okunur
+    index = faiss.read_index(os.path.join(store_path, "index.faiss"), INDEX_MMAP_FLAGS if mmap else 0)
+    set_search_params(index)
+    # Embedding matrisi RAM'e kopyalanmaz, diskten memory-map edilir
+    embeddings = np.load(os.path.join(store_path, "embeddings.npy"), mmap_mode="r")
+
+    records = []
+    with open(os.path.join(store_path, "chunks.jsonl"), "r", encoding="utf-8") as f:
+        for line in f:
+            records.append(json.loads(line))
+
+    documents = [Document(page_content=r["content"], metadata=r["metadata"]) for r in records]
+
+    # Index, IndexIDMap2 ile kalıcı chunk id'lerini döndürür; docstore da aynı id'lerle tutulur
+    docstore = InMemoryDocstore({str(r["id"]): doc for r, doc in zip(records, documents)})
+    index_to_docstore_id = {r["id"]: str(r["id"]) for r in records}
+    vector_db = FAISS(embed_model, index, docstore, index_to_docstore_id)
+    return vector_db, documents, embeddings, records
+
+def update_index_store(store_path, embed_model, corpus_key):
+    """
+    Sadece yeni/değişen chunk'ları embed eder, silinenleri id üzerinden index'ten çıkarır.
+    Süre, tüm korpusa değil değişen parça sayısına bağlıdır.
+    """
+    documents = load_rag_documents(RAG_SOURCE_FILE)
+    manifest = read_manifest(store_path)
+
+    old_records, old_embeddings, index = [], None, None
+    trained_count = 0
+    if manifest and manifest.get("embed_model") == embed_model.model_key:
+        old_db, _, old_embeddings, old_records = load_index_store(store_path, embed_model)
+        index = old_db.index
+        next_id = manifest["next_id"]
+        # Index türü/ayarları değiştiyse eski index kullanılmaz (embedding'ler yine de korunur)
+        if manifest.get("index", {"backend": "flat"}) != index_params():
+            index = None
+        trained_count = manifest.get("trained_count", 0)
+    else:
+        next_id = 0
+
+    old_by_hash = {r["hash"]: (row, r["id"]) for row, r in enumerate(old_records)}
+
+    # --- ADIM 1: FARK ÇIKARMA (hash ile) ---
+    records, old_rows, new_positions = [], [], []
+    seen_hashes = set()
+    for doc in documents:
+        chunk_hash = compute_chunk_hash(doc)
+        if chunk_hash in seen_hashes:   # Birebir aynı chunk iki kez indekslenmesin
+            continue
+        seen_hashes.add(chunk_hash)
+
+        record = {"id": None, "hash": chunk_hash, "content": doc.page_content, "metadata": doc.metadata}
+        if chunk_hash in old_by_hash:
+            row, record["id"] = old_by_hash[chunk_hash]
+            old_rows.append((len(records), row))
+        else:
+            new_positions.append(len(records))
+        records.append(record)
+
+    removed_ids = [chunk_id for h, (_, chunk_id) in old_by_hash.items() if h not in seen_hashes]
+
+    # --- ADIM 2: SADECE YENİ PARÇALARI EMBED ET ---
+    new_texts = [indexing_text(records[pos]["content"], records[pos]["metadata"]) for pos in new_positions]
+    new_vectors = np.asarray(embed_model.embed_documents(new_texts), dtype=np.float32) if new_texts else None
+
+    dim = new_vectors.shape[1] if new_texts else old_embeddings.shape[1]
+
+    new_ids = np.arange(next_id, next_id + len(new_positions), dtype=np.int64)
+    for pos, chunk_id in zip(new_positions, new_ids):
+        records[pos]["id"] = int(chunk_id)
+    next_id += len(new_positions)
+
+    embeddings = np.empty((len(records), dim), dtype=np.float32)
+    if old_rows:
+        positions, rows = (np.asarray(x) for x in zip(*old_rows))
+        embeddings[positions] = old_embeddings[rows]
+    if new_texts:
+        embeddings[new_positions] = new_vectors
+
+    # --- ADIM 3: INDEX'İ YERİNDE GÜNCELLE (ya da gerekiyorsa yeniden kur) ---
+    # HNSW silmeyi desteklemez; IVF-PQ kümeleri korpus çok büyüyünce eskir
+    rebuild = (
+        index is None
+        or (removed_ids and INDEX_BACKEND == "hnsw_sq8")
+        or (INDEX_BACKEND == "ivfpq" and len(records) > INDEX_RETRAIN_GROWTH * trained_count)
+    )
+    if rebuild:
+        index = build_vector_index(INDEX_BACKEND, embeddings, [r["id"] for r in records])
+        trained_count = len(records)
+        if INDEX_REPORT and INDEX_BACKEND != "flat" and len(records):
+            index_quality_report(index, embeddings, [r["id"] for r in records])
+    else:
+        if removed_ids:
+            index.remove_ids(np.asarray(removed_ids, dtype=np.int64))
+        if new_texts:
+            index.add_with_ids(new_vectors, new_ids)
+
+    manifest = {
+        "corpus_key": corpus_key,
+        "embed_model": embed_model.model_key,
+        "source_file": RAG_SOURCE_FILE,
+        "dim": int(dim),
+        "index": index_params(),
+        "trained_count": trained_count,
+        "count": len(records),
+        "next_id": int(next_id),
+        "last_update": {
+            "added": len(new_positions),
+            "removed": len(removed_ids),
+            "kept": len(old_rows),
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "chunks": {r["hash"]: r["id"] for r in records},
+    }
+    save_index_store(store_path, records, embeddings, index, manifest)
+    print(f"🔁 Index güncellendi ({INDEX_BACKEND}{', yeniden kuruldu' if rebuild else ''}): "
+          f"+{len(new_positions)} yeni, -{len(removed_ids)} silinen, {len(old_rows)} aynen korundu.")
+
+    return load_index_store(store_path, embed_model, mmap=INDEX_MMAP)
+
+# --- HİBRİT ARAMA: BM25 (Kelime) + FAISS (Vektör) ---
+# MiniLM, "spring.datasource.hikari.maximum-pool-size" veya "@ConfigurationProperties" gibi
+# birebir tanımlayıcıları çoğu zaman kaçırır. Aynı dokümanlar üzerinde bir BM25 ters index'i
+# kurulur ve iki sıralama Reciprocal Rank Fusion (RRF) ile birleştirilir.
+HYBRID_SEARCH_ENABLED = True
+HYBRID_CANDIDATES = 20   # Her iki yöntemden alınan aday sayısı
+RRF_K = 60               # RRF sabiti: skor = Σ 1 / (RRF_K + sıra)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+BM25_TOKEN_PATTERN = re.compile(r"@?[A-Za-z0-9_]+(?:[.\-][A-Za-z0-9_]+)*")
+
+def tokenize_for_bm25(text):
+    # Tanımlayıcı hem bütün olarak hem de parçalarıyla indekslenir:
+    # "spring.datasource.url" -> ["spring.datasource.url", "spring", "datasource", "url"]
+    tokens = []
+    for match in BM25_TOKEN_PATTERN.findall(text):
+        token = match.lower()
+        tokens.append(token)
+        if "." in token or "-" in token or token.startswith("@"):
+            tokens.extend(part for part in re.split(r"[.\-@]", token) if part)
+    return tokens
+
+class BM25Index:
+    """
+    Postings listeleri CSR düzeninde numpy dizilerinde tutulur:
+    terim t'nin dokümanları = doc_ids[offsets[t]:offsets[t + 1]], BM25 ağırlıkları önceden hesaplanır.
+    """
+    def __init__(self, texts, k1=BM25_K1, b=BM25_B):
+        self.vocab = {}
+        term_ids, doc_ids, term_freqs = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for doc_pos, text in enumerate(texts):
+            counts = Counter(tokenize_for_bm25(text))
+            doc_lengths[doc_pos] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_ids.append(doc_pos)
+                term_freqs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        term_ids = term_ids[order]
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        tf = np.asarray(term_freqs, dtype=np.float32)[order]
+
+        doc_freq = np.bincount(term_ids, minlength=len(self.vocab))
+        self.offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=self.offsets[1:])
+
+        n_docs = len(texts)
+        idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        avg_len = doc_lengths.mean() if n_docs else 1.0
+        norm = k1 * (1 - b + b * doc_lengths[self.doc_ids] / avg_len)
+        self.weights = (idf[term_ids] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+        self.n_docs = n_docs
+
+    def search(self, query, top_k):
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize_for_bm25(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k)[:top_k]]
+        return hits[np.argsort(-scores[hits], kind="stable")].tolist()
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def hybrid_search(query_text, query_vector, k=3, candidates=HYBRID_CANDIDATES):
+    query = np.asarray([query_vector], dtype=np.float32)
+    _, ids = vector_db.index.search(query, candidates)
+    vector_ranking = [vector_db.index_to_docstore_id[int(i)] for i in ids[0] if i != -1]
+
+    rankings = [vector_ranking]
+    if bm25_index is not None:
+        rankings.append([rag_doc_ids[pos] for pos in bm25_index.search(query_text, candidates)])
+
+    fused = reciprocal_rank_fusion(rankings)
+    return [vector_db.docstore.search(doc_id) for doc_id in fused[:k]]
+
+try:
+    embed_model = EmbeddingService(
+        EMBED_MODEL_NAME, backend=EMBED_BACKEND, device=EMBED_DEVICE, onnx_file=EMBED_ONNX_FILE,
+        batch_size=EMBED_BATCH_SIZE, autotune=EMBED_AUTOTUNE, cache_size=EMBED_QUERY_CACHE_SIZE,
+        max_batch=EMBED_QUERY_MAX_BATCH, max_wait_ms=EMBED_QUERY_MAX_WAIT_MS,
+    )
+
+    start_time = time.perf_counter()
+    corpus_key = compute_corpus_key(RAG_SOURCE_FILE)
+    manifest = read_manifest(INDEX_STORE_DIR)
+
+    if manifest and manifest.get("corpus_key") == corpus_key and manifest.get("embed_model") == embed_model.model_key \
+            and manifest.get("index", {"backend": "flat"}) == index_params():
+        vector_db, documents, rag_embeddings, rag_records = load_index_store(INDEX_STORE_DIR, embed_model, mmap=INDEX_MMAP)
+        print(f"⚡ Kayıtlı index diskten yüklendi ({corpus_key}) - {time.perf_counter() - start_time:.2f} sn")
+    else:
+        print(f"🧮 Veri/index ayarı değişmiş ya da index yok, değişen parçalar embed ediliyor ({corpus_key})...")
+        vector_db, documents, rag_embeddings, rag_records = update_index_store(INDEX_STORE_DIR, embed_model, corpus_key)
+        print(f"💾 Index diske kaydedildi: {INDEX_STORE_DIR} - {time.perf_counter() - start_time:.2f} sn")
 
-    embed_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vector_db = FAISS.from_documents(documents, embed_model)
     print(f"✅ Vektör Veritabanı Hazır! {len(documents)} kaliteli parça indekslendi.")
 
 except Exception as e:
     print(f"❌ RAG Hatası: {e}")
     vector_db = None
 
+bm25_index = None
+if vector_db and HYBRID_SEARCH_ENABLED:
+    start_time = time.perf_counter()
+    rag_doc_ids = [str(r["id"]) for r in rag_records]   # BM25 sırası -> docstore id
+    bm25_index = BM25Index([indexing_text(d.page_content, d.metadata) for d in documents])
+    print(f"🔤 BM25 index'i hazır: {len(bm25_index.vocab)} terim - {time.perf_counter() - start_time:.2f} sn")
+
 
 # ==============================================================================
 # HÜCRE 5: FLASK API, UI & NGROK (TAM KOD)
 # ==============================================================================
 print("\n🌐 Web Sunucusu ve Arayüz Hazırlanıyor...")
 
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, render_template_string, Response, stream_with_context
 from pyngrok import ngrok
 from flask_cors import CORS
+from threading import Thread
+from collections import deque, OrderedDict
+from functools import lru_cache
+from contextlib import contextmanager
+import copy
+import math
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+import uvicorn
+import threading
+import atexit
+import re
+import queue
+import time
+import numpy as np
+import faiss
 import torch
 
 # --- 1. MODERN CHATGPT BENZERİ ARAYÜZ (HTML/CSS/JS) ---
@@ -406,30 +1512,79 @@ HTML_TEMPLATE = """
             // Loading göster
             document.getElementById('loading').style.display = 'block';
 
+            let contentDiv = null;
+            let answer = '';
+
             try {
-                const response = await fetch('/chat', {
+                // Cevap /chat/stream üzerinden (SSE) token token gelir
+                const response = await fetch('/chat/stream', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ question: message })
                 });
 
-                const data = await response.json();
-
-                // Loading gizle
-                document.getElementById('loading').style.display = 'none';
+                if (!response.ok) {
+                    const data = await response.json();
+                    throw new Error(data.error || response.statusText);
+                }
 
-                if (data.error) {
-                    addMessage('bot', '**Hata:** ' + data.error);
-                } else {
-                    addMessage('bot', data.response);
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split('\\n\\n');
+                    buffer = events.pop();
+
+                    for (const rawEvent of events) {
+                        let eventType = 'message';
+                        let dataLine = '';
+                        for (const line of rawEvent.split('\\n')) {
+                            if (line.startsWith('event: ')) eventType = line.slice(7);
+                            else if (line.startsWith('data: ')) dataLine += line.slice(6);
+                        }
+                        if (!dataLine) continue;
+                        const data = JSON.parse(dataLine);
+
+                        if (eventType === 'error') throw new Error(data.error);
+                        if (eventType !== 'message') continue;
+
+                        // İlk token geldiğinde "yazıyor..." yazısını kaldır, balonu aç
+                        if (!contentDiv) {
+                            document.getElementById('loading').style.display = 'none';
+                            contentDiv = addMessage('bot', '');
+                        }
+                        answer += data.token;
+                        renderBotContent(contentDiv, answer);
+                    }
                 }
 
+                document.getElementById('loading').style.display = 'none';
+                if (!contentDiv) addMessage('bot', answer);
+                else highlightCode(contentDiv);
+
             } catch (error) {
                 document.getElementById('loading').style.display = 'none';
-                addMessage('bot', '**Bağlantı Hatası:** Sunucuya ulaşılamadı.');
+                addMessage('bot', '**Hata:** ' + (error.message || 'Sunucuya ulaşılamadı.'));
             }
         }
 
+        function renderBotContent(contentDiv, text) {
+            contentDiv.innerHTML = marked.parse(text);
+            const messagesDiv = document.getElementById('messages');
+            messagesDiv.scrollTop = messagesDiv.scrollHeight;
+        }
+
+        function highlightCode(root) {
+            root.querySelectorAll('pre code').forEach((block) => {
+                hljs.highlightElement(block);
+            });
+        }
+
         function addMessage(role, text) {
             const messagesDiv = document.getElementById('messages');
             const msgDiv = document.createElement('div');
@@ -449,9 +1604,9 @@ HTML_TEMPLATE = """
             messagesDiv.scrollTop = messagesDiv.scrollHeight;
 
             // Kod bloklarını renklendir (yeni eklenenler için)
-            document.querySelectorAll('pre code').forEach((block) => {
-                hljs.highlightElement(block);
-            });
+            highlightCode(msgDiv);
+
+            return msgDiv.querySelector('.content');
         }
     </script>
 </body>
@@ -464,42 +1619,876 @@ CORS(app)
 # Modeli Çıkarım Moduna Al
 FastLanguageModel.for_inference(model)
 
+# --- METRİKLER (Prometheus formatında /metrics) ---
+# Her isteğin süresi aşamalara bölünür (çeviri, embedding, arama, prompt, üretim, decode);
+# kuyruk bekleme süresi ve token sayıları histogramlarda toplanır.
+METRICS_LOG_REQUESTS = True   # Her istek için tek satırlık JSON log bas
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+class MetricsRegistry:
+    def __init__(self):
+        self.histograms = {}   # isim -> (yardım metni, bucket'lar, {etiketler: Histogram})
+        self.counters = {}     # isim -> (yardım metni, {etiketler: değer})
+        self.gauges = {}       # isim -> (yardım metni, değer döndüren fonksiyon)
+        self.lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.histograms[name] = (help_text, buckets, {})
+
+    def counter(self, name, help_text):
+        self.counters[name] = (help_text, {})
+
+    def gauge(self, name, help_text, read_value):
+        self.gauges[name] = (help_text, read_value)
+
+    def observe(self, name, value, **labels):
+        _, buckets, series = self.histograms[name]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def inc(self, name, value=1, **labels):
+        _, series = self.counters[name]
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series[key] = series.get(key, 0) + value
+
+    @staticmethod
+    def _labels(pairs):
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, series) in self.counters.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for key, value in series.items():
+                    lines.append(f"{name}{self._labels(key)} {value}")
+            for name, (help_text, buckets, series) in self.histograms.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for key, hist in series.items():
+                    for bound, count in zip(buckets, hist.counts):
+                        lines.append(f"{name}_bucket{self._labels(key + (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{self._labels(key + (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{name}_sum{self._labels(key)} {hist.total}")
+                    lines.append(f"{name}_count{self._labels(key)} {hist.count}")
+        for name, (help_text, read_value) in self.gauges.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {read_value()}"]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.histogram("chat_request_seconds", "Uçtan uca /chat süresi")
+metrics.histogram("chat_stage_seconds", "Aşama bazında süre (translate, embed, retrieve, prompt, generate, decode...)")
+metrics.histogram("chat_queue_wait_seconds", "Scheduler kuyruğunda bekleme süresi")
+metrics.histogram("chat_prompt_tokens", "Prompt token sayısı", TOKEN_BUCKETS)
+metrics.histogram("chat_generated_tokens", "Üretilen token sayısı", TOKEN_BUCKETS)
+metrics.histogram("chat_tokens_per_second", "Üretim hızı (token/sn)", TOKENS_PER_SECOND_BUCKETS)
+metrics.histogram("chat_inference_batch_size", "Scheduler batch boyutu", (1, 2, 4, 8, 16, 32))
+metrics.counter("chat_requests_total", "Tamamlanan istek sayısı (status: ok, cached, busy, error, cancelled)")
+
+class RequestMetrics:
+    """
+    Tek bir isteğin aşama süreleri ve token sayıları; istek bitince histogramlara yazılır.
+    """
+    def __init__(self, route):
+        self.route = route
+        self.started_at = time.perf_counter()
+        self.stages = {}
+        self.tokens = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        metrics.observe("chat_stage_seconds", seconds, stage=name)
+
+    def record_job(self, kind, job):
+        # kind: "translate" veya "answer"
+        metrics.observe("chat_queue_wait_seconds", job.queue_wait, kind=kind)
+        self.stages[f"{kind}_queue_wait"] = job.queue_wait
+        if job.generate_seconds is not None:
+            self.add_stage(f"{kind}_generate", job.generate_seconds)
+        if job.decode_seconds is not None:
+            self.add_stage(f"{kind}_decode", job.decode_seconds)
+        if job.prompt_tokens is not None:
+            metrics.observe("chat_prompt_tokens", job.prompt_tokens, kind=kind)
+            metrics.observe("chat_generated_tokens", job.generated_tokens, kind=kind)
+            self.tokens[kind] = {"prompt": job.prompt_tokens, "generated": job.generated_tokens}
+            if job.generate_seconds:
+                tokens_per_second = job.generated_tokens / job.generate_seconds
+                metrics.observe("chat_tokens_per_second", tokens_per_second, kind=kind)
+                self.tokens[kind]["tokens_per_second"] = round(tokens_per_second, 2)
+
+    def finish(self, status):
+        total = time.perf_counter() - self.started_at
+        metrics.observe("chat_request_seconds", total, route=self.route)
+        metrics.inc("chat_requests_total", route=self.route, status=status)
+        if METRICS_LOG_REQUESTS:
+            print(json.dumps({
+                "event": "chat_request",
+                "route": self.route,
+                "status": status,
+                "total_ms": round(total * 1000, 1),
+                "stages_ms": {k: round(v * 1000, 1) for k, v in self.stages.items()},
+                "tokens": self.tokens,
+            }, ensure_ascii=False))
+
+# --- ÇIKARIM ZAMANLAYICISI (Inference Scheduler) ---
+# Flask thread'leri modele doğrudan dokunmaz. Tüm generate çağrıları tek bir worker
+# thread'inde sıraya girer; bekleyen prompt'lar birlikte (batch) işlenir.
+INFERENCE_MAX_BATCH_SIZE = 8      # Tek seferde işlenecek en fazla prompt
+INFERENCE_MAX_WAIT_MS = 20        # İlk istekten sonra batch'in dolmasını bekleme süresi
+INFERENCE_MAX_QUEUE_SIZE = 32     # Kuyruk bu sayıya ulaşınca yeni istekler reddedilir
+INFERENCE_REQUEST_TIMEOUT = 300   # Bir isteğin sonucunu bekleme sınırı (sn)
+PREFIX_CACHE_ENABLED = True       # Sabit sistem prompt'larının KV cache'i bir kez hesaplanıp her istekte yeniden kullanılır
+
+# --- ÜRETİM PROFİLLERİ ---
+# Her istek türünün kendi token bütçesi ve durma koşulları var. Üretim EOS/<|eot_id|> ya da
+# bir stop string'de biter; cevap sadece yeni üretilen token'lardan çözülür, stop string'den sonrası atılır.
+STOP_TOKENS = ("<|eot_id|>", "<|end_of_text|>", "<|start_header_id|>")
+GENERATION_PROFILES = {
+    # Çeviri kısa: bütçe soru uzunluğuyla orantılı, tek paragraf (boş satırdan sonrası cevaplamaya kayar)
+    "translate": {"max_new_tokens": 64, "min_new_tokens": 16, "tokens_per_input_token": 2.0,
+                  "stop_strings": ("\n\n",), "generate": {}},
+    # Cevap: bağlam penceresine sığdığı kadar; prompt iskeleti tekrar edilirse durur
+    "answer": {"max_new_tokens": 1024, "stop_strings": ("[BAĞLAM]", "SORU:"),
+               "generate": {"use_cache": True, "temperature": 0.3}},
+}
+
+class SchedulerBusyError(Exception):
+    pass
+
+class InferenceJob:
+    def __init__(self, prompt, gen_kwargs, streamer=None, prefix=None):
+        self.prompt = prompt
+        self.gen_kwargs = gen_kwargs
+        self.streamer = streamer
+        self.prefix = prefix   # Kayıtlı sabit prefix (KV cache'i hazır), yoksa None
+        self.batch_key = (prefix, tuple(sorted(gen_kwargs.items())))
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Metrikler (worker doldurur)
+        self.generate_seconds = None
+        self.decode_seconds = None
+        self.prompt_tokens = None
+        self.generated_tokens = None
+        self.stop_reason = None   # eos | stop_string | length | cancelled
+        self.cancelled = threading.Event()
+
+    @property
+    def queue_wait(self):
+        return (self.started_at or time.perf_counter()) - self.enqueued_at
+
+    def cancel(self):
+        # Sonucu artık kimse beklemiyor (ör. akış istemcisi koptu): üretim bir sonraki token'da durur
+        self.cancelled.set()
+
+class CancelledCriteria(StoppingCriteria):
+    # Batch'in her satırı kendi işine karşılık gelir; iptal edilen satır bitmiş sayılır
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor([job.cancelled.is_set() for job in self.jobs], device=input_ids.device)
+
+class InferenceScheduler:
+    def __init__(self, model, tokenizer, device="cuda", max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                 max_wait_ms=INFERENCE_MAX_WAIT_MS, max_queue_size=INFERENCE_MAX_QUEUE_SIZE):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.backlog = deque()   # Farklı ayarlarla gelen, bir sonraki tura kalan işler (sadece worker kullanır)
+        self.prefixes = []        # register_prefix ile kaydedilen sabit prompt başlangıçları
+        self.stop_token_ids = self._stop_token_ids()
+        self.prefix_states = {}   # prefix -> (token id'leri, past_key_values); worker ilk kullanımda hesaplar
+
+        # Batch'lerde prompt'lar sola hizalanır; üretim sağ uçtan devam eder
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.worker = Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _stop_token_ids(self):
+        ids = [self.tokenizer.eos_token_id]
+        vocab = self.tokenizer.get_vocab() if hasattr(self.tokenizer, "get_vocab") else {}
+        for token in STOP_TOKENS:
+            if token in vocab and vocab[token] not in ids:
+                ids.append(vocab[token])
+        return ids
+
+    def register_prefix(self, prefix):
+        # Prefix özel bir token ile bitmeli (ör. <|end_header_id|>): devamı ayrı tokenize edildiğinde
+        # tam prompt'la aynı token'lara bölünür ve cache'li üretim birebir aynı kalır.
+        if PREFIX_CACHE_ENABLED:
+            self.prefixes.append(prefix)
+
+    def _match_prefix(self, prompt):
+        for prefix in self.prefixes:
+            if prompt.startswith(prefix):
+                return prefix
+        return None
+
+    def submit(self, prompt, streamer=None, **gen_kwargs):
+        job = InferenceJob(prompt, gen_kwargs, streamer, prefix=self._match_prefix(prompt))
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            raise SchedulerBusyError("Sunucu şu an çok yoğun, lütfen biraz sonra tekrar deneyin.")
+        return job
+
+    def run(self, prompt, timeout=INFERENCE_REQUEST_TIMEOUT, **gen_kwargs):
+        job = self.submit(prompt, **gen_kwargs)
+        if not job.done.wait(timeout):
+            # Sonucu bekleyen kalmadı: iş kuyruktaysa hiç çalıştırılmaz, çalışıyorsa bir sonraki token'da durur
+            job.cancel()
+            raise TimeoutError("Model cevabı zaman aşımına uğradı.")
+        if job.error:
+            raise job.error
+        return job
+
+    def generate(self, prompt, timeout=INFERENCE_REQUEST_TIMEOUT, **gen_kwargs):
+        return self.run(prompt, timeout=timeout, **gen_kwargs).result
+
+    def _next_job(self, timeout=None):
+        # Beklerken iptal edilen işler (zaman aşımı, kopan akış) prefill yapılmadan atlanır
+        while True:
+            job = self.backlog.popleft() if self.backlog else self.queue.get(timeout=timeout)
+            if not job.cancelled.is_set():
+                return job
+            job.stop_reason = "cancelled"
+            metrics.inc("chat_generation_stops_total", reason=job.stop_reason)
+            if job.streamer is not None:
+                job.streamer.end()
+            job.done.set()
+
+    def _collect_batch(self):
+        first = self._next_job()
+        batch = [first]
+        # Streaming işi tek başına çalışır (streamer tek satırlık batch destekler)
+        if first.streamer is not None:
+            return batch
+
+        deferred = []
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 and not self.backlog:
+                break
+            try:
+                job = self._next_job(timeout=max(remaining, 0.001))
+            except queue.Empty:
+                break
+            if job.streamer is None and job.batch_key == first.batch_key:
+                batch.append(job)
+            else:
+                deferred.append(job)
+
+        self.backlog.extendleft(reversed(deferred))
+        return batch
+
+    def _prefix_state(self, prefix):
+        state = self.prefix_states.get(prefix)
+        if state is None:
+            ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"].to(self.device)
+            with torch.inference_mode():
+                cache = self.model(input_ids=ids, use_cache=True).past_key_values
+            state = self.prefix_states[prefix] = (ids, cache)
+            print(f"🧊 Prefix KV cache hazır: {ids.shape[1]} token")
+        return state
+
+    def _disable_prefix_cache(self, error):
+        # Model hazır cache ile üretimi desteklemiyorsa özellik kapatılır, işler tam prompt'la çalışır
+        print(f"⚠️ Prefix KV cache kullanılamadı, devre dışı bırakıldı: {error}")
+        self.prefixes.clear()
+        self.prefix_states.clear()
+
+    def _encode_batch(self, batch):
+        # Dönüş: (model girdileri, generate'e eklenecek cache argümanları)
+        self.tokenizer.padding_side = "left"
+        prefix = batch[0].prefix
+        if prefix is not None and prefix in self.prefixes:
+            try:
+                return self._encode_with_prefix(batch, prefix)
+            except Exception as e:
+                self._disable_prefix_cache(e)
+        inputs = self.tokenizer([job.prompt for job in batch], return_tensors="pt", padding=True).to(self.device)
+        return inputs, {}
+
+    def _encode_with_prefix(self, batch, prefix):
+        # Prefix token'ları hazır cache'ten gelir, sadece her isteğin kendi kısmı prefill edilir.
+        # Dolgu prefix ile devamın arasına düşer; attention_mask onu gizler, pozisyonlar maskeden hesaplanır.
+        prefix_ids, prefix_cache = self._prefix_state(prefix)
+        suffix = self.tokenizer(
+            [job.prompt[len(prefix):] for job in batch],
+            return_tensors="pt", padding=True, add_special_tokens=False,
+        ).to(self.device)
+        rows = len(batch)
+        inputs = {
+            "input_ids": torch.cat([prefix_ids.expand(rows, -1), suffix["input_ids"]], dim=1),
+            "attention_mask": torch.cat([torch.ones_like(prefix_ids).expand(rows, -1), suffix["attention_mask"]], dim=1),
+        }
+        cache = copy.deepcopy(prefix_cache)   # generate cache'i yerinde büyütür, asıl kopya korunur
+        if rows > 1:
+            cache.batch_repeat_interleave(rows)
+        return inputs, {"past_key_values": cache}
+
+    def _run_batch(self, batch):
+        started_at = time.perf_counter()
+        for job in batch:
+            job.started_at = started_at
+
+        inputs, cache_kwargs = self._encode_batch(batch)
+        gen_kwargs = dict(batch[0].gen_kwargs, pad_token_id=self.tokenizer.pad_token_id, eos_token_id=self.stop_token_ids)
+        stop_strings = gen_kwargs.pop("stop_strings", None)
+        if stop_strings:
+            gen_kwargs.update(stop_strings=list(stop_strings), tokenizer=self.tokenizer)
+        # Bütçe bağlam penceresini aşamaz
+        room = MAX_SEQ_LENGTH - inputs["input_ids"].shape[1]
+        gen_kwargs["max_new_tokens"] = max(1, min(gen_kwargs.get("max_new_tokens", room), room))
+        if batch[0].streamer is not None:
+            gen_kwargs["streamer"] = batch[0].streamer
+        gen_kwargs["stopping_criteria"] = StoppingCriteriaList([CancelledCriteria(batch)])
+
+        with torch.inference_mode():
+            try:
+                outputs = self.model.generate(**inputs, **gen_kwargs, **cache_kwargs)
+            except Exception as e:
+                # Streaming işinde prompt streamer'a gitmiş olabilir, tekrar denenmez
+                if not cache_kwargs or batch[0].streamer is not None:
+                    raise
+                self._disable_prefix_cache(e)
+                inputs, _ = self._encode_batch(batch)
+                outputs = self.model.generate(**inputs, **gen_kwargs)
+        generated_at = time.perf_counter()
+
+        # Sola hizalı olduğu için her satırda yeni token'lar aynı sütundan başlar
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        results = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        results, cut = zip(*(trim_at_stop(text, stop_strings) for text in results))
+        decoded_at = time.perf_counter()
+
+        prompt_tokens = inputs["attention_mask"].sum(dim=1).tolist()
+        generated_tokens = (new_tokens != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        metrics.observe("chat_inference_batch_size", len(batch))
+        for i, job in enumerate(batch):
+            job.generate_seconds = generated_at - started_at
+            job.decode_seconds = decoded_at - generated_at if job.streamer is None else None
+            job.prompt_tokens = int(prompt_tokens[i])
+            job.generated_tokens = int(generated_tokens[i])
+            if job.cancelled.is_set():
+                job.stop_reason = "cancelled"
+            elif cut[i]:
+                job.stop_reason = "stop_string"
+            elif job.generated_tokens >= gen_kwargs["max_new_tokens"]:
+                job.stop_reason = "length"
+            else:
+                job.stop_reason = "eos"
+            metrics.inc("chat_generation_stops_total", reason=job.stop_reason)
+        return list(results)
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                results = self._run_batch(batch)
+                for job, result in zip(batch, results):
+                    job.result = result
+            except Exception as e:
+                print(f"HATA (scheduler): {e}")
+                for job in batch:
+                    job.error = e
+                    if job.streamer is not None:
+                        job.streamer.end()
+            finally:
+                for job in batch:
+                    job.done.set()
+
+def trim_at_stop(text, stop_strings):
+    # Üretim stop string'i ürettikten sonra durur; metin ilk stop string'in başından kesilir.
+    # Baştaki boşluk (ör. assistant başlığından sonraki "\n\n") stop sayılmaz, cevap başlamadan kesilmez
+    text = text.lstrip()
+    cuts = [text.find(stop) for stop in stop_strings or () if stop in text]
+    if not cuts:
+        return text, False
+    return text[:min(cuts)], True
+
+def generation_kwargs(kind, source_text=None):
+    profile = GENERATION_PROFILES[kind]
+    budget = profile["max_new_tokens"]
+    if source_text is not None and "tokens_per_input_token" in profile:
+        source_tokens = len(tokenizer.encode(source_text, add_special_tokens=False))
+        needed = profile["min_new_tokens"] + profile["tokens_per_input_token"] * source_tokens
+        # 2'nin kuvvetine yuvarlanır: bütçe batch anahtarına girer, benzer uzunluktaki istekler yine birlikte işlenir
+        budget = min(budget, 1 << math.ceil(math.log2(needed)))
+    return dict(profile["generate"], max_new_tokens=budget, stop_strings=profile["stop_strings"])
+
+inference_scheduler = InferenceScheduler(model, tokenizer)
+metrics.counter("chat_generation_stops_total", "Üretimin bitiş nedeni (reason: eos, stop_string, length, cancelled)")
+metrics.gauge("chat_queue_depth", "Scheduler kuyruğunda bekleyen iş sayısı", inference_scheduler.queue.qsize)
+
 # --- ROUTE 1: ARAYÜZ (HTML) ---
 @app.route('/', methods=['GET'])
 def home():
     return render_template_string(HTML_TEMPLATE)
 
-# --- ROUTE 2: CHAT API (RAG + MODEL) ---
-@app.route('/chat', methods=['POST'])
-def chat():
-    try:
-        data = request.json
-        user_question = data.get('question', '')
-
-        if not user_question: return jsonify({"error": "Soru boş olamaz"}), 400
-
-        print(f"📩 Web Arayüzünden Gelen Soru: {user_question}")
+# --- DİL TESPİTİ & ÇEVİRİ ÖNBELLEĞİ ---
+# Soru zaten İngilizceyse çeviri için model hiç çağrılmaz.
+# Türkçe sorularda ise aynı (ya da sadece büyük/küçük harf, noktalama farkı olan) soru
+# tekrar geldiğinde çeviri önbellekten okunur.
+TRANSLATION_CACHE_SIZE = 1024
+TRANSLATION_CACHE_TTL = 3600   # sn
+
+TURKISH_CHARS = set("çğıöşüÇĞİÖŞÜ")
+TURKISH_WORDS = {
+    "ve", "veya", "bir", "bu", "şu", "ne", "neden", "nasıl", "nasil", "nedir", "hangi", "nerede",
+    "için", "icin", "ile", "mi", "mı", "mu", "mü", "da", "de", "ki", "gibi", "daha", "çok", "cok",
+    "ama", "fakat", "olarak", "arasındaki", "arasindaki", "fark", "farkı", "farki", "yapılır",
+    "yapilir", "kullanılır", "kullanilir", "kullanmalıyım", "kullanmaliyim", "örnek", "ornek",
+    "lütfen", "lutfen", "yaz", "göster", "goster", "anlat", "açıkla", "acikla", "var", "yok",
+    # Türkçe karakter olmadan (ASCII) yazılan yaygın biçimler
+    "misin", "musun", "misiniz", "musunuz", "ornegi", "ornekle", "yazar", "yapar", "yapabilir",
+    "tanimlama", "tanimlanir", "kullanimi", "kullanma", "nasildir", "nelerdir", "hakkinda", "neler",
+    "ayarlama", "ayarlanir", "olusturma", "olusturulur", "nedenleri", "sadece", "bana", "bunu",
+}
+ENGLISH_WORDS = {
+    "the", "a", "an", "and", "or", "is", "are", "was", "be", "to", "of", "in", "on", "for", "with",
+    "how", "what", "why", "which", "when", "where", "can", "could", "should", "do", "does", "i",
+    "my", "me", "you", "it", "this", "that", "use", "using", "between", "difference", "example",
+    "configure", "create", "write", "show", "explain", "please",
+}
+TURKISH_SUFFIX_PATTERN = re.compile(
+    r"\w+(iyor|ıyor|uyor|üyor|abilir|ebilir|miyim|mıyım|misin|musun|mısın|müsün|"
+    r"lari|leri|ları|lerı|ini|ını|unu|ünü|mak|mek|ması|mesi|masi)$"
+)
+# Sadece kod adlarından oluşan soru (@Annotation, paket.adı, spring-boot-starter, CamelCase) çevrilmez
+IDENTIFIER_PATTERN = re.compile(r"^(@\w+|\w+([.\-]\w+)+|\w*[a-z][A-Z]\w*)[?.!,]*$")
+
+def is_english_question(text):
+    # Türkçeye özgü harf varsa kesin Türkçe
+    if any(ch in TURKISH_CHARS for ch in text):
+        return False
+
+    tokens = text.split()
+    if tokens and all(IDENTIFIER_PATTERN.match(tok) for tok in tokens):
+        return True
+
+    words = re.findall(r"[a-z]+", text.lower())
+    turkish_score = sum(1 for w in words if w in TURKISH_WORDS or TURKISH_SUFFIX_PATTERN.match(w))
+    english_score = sum(1 for w in words if w in ENGLISH_WORDS)
+
+    # Çeviri sadece açık İngilizce kanıt varsa atlanır; ipucu yoksa (ör. ASCII yazılmış Türkçe) çevrilir
+    return english_score > 0 and english_score > turkish_score
+
+def normalize_question(text):
+    # Türkçe büyük/küçük harf: "I" -> "ı", "İ" -> "i" (yoksa "KULLANILIR" != "kullanılır" olur)
+    text = text.replace("I", "ı").replace("İ", "i").lower()
+    return re.sub(r"[^\w@.\-]+", " ", text).strip(" .")
+
+class TTLCache:
+    """
+    Thread-safe LRU önbellek; her kayıt `ttl` saniye sonra geçersiz olur.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + self.ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+translation_cache = TTLCache(TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL)
+
+# --- SEMANTİK CEVAP ÖNBELLEĞİ ---
+# Daha önce cevaplanmış soruların MiniLM vektörleri küçük, ayrı bir FAISS index'inde tutulur.
+# Yeni soru bunlardan birine yeterince benziyorsa (kosinüs >= eşik) kayıtlı cevap döner;
+# çeviri dışında hiçbir adım (RAG arama, 1024 token'lık üretim) tekrar çalışmaz.
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_THRESHOLD = 0.92      # Kosinüs benzerliği eşiği
+SEMANTIC_CACHE_MAX_ENTRIES = 2000    # Dolunca en uzun süredir kullanılmayan kayıt silinir
+SEMANTIC_CACHE_DIR = "semantic_cache"  # None -> sadece bellekte tutulur
+SEMANTIC_CACHE_SAVE_EVERY = 20       # Her N yeni kayıtta bir diske yaz
+
+class SemanticCache:
+    def __init__(self, threshold, max_entries, path=None, corpus_key=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.corpus_key = corpus_key
+        self.index = None
+        self.entries = OrderedDict()   # id -> {"question", "answer"}; sıra = LRU sırası
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.unsaved = 0
+        self.lock = threading.Lock()
+        if path:
+            self.load()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(vector)   # İç çarpım = kosinüs benzerliği
+        return vector
+
+    def lookup(self, query_vector):
+        vector = self._normalize(query_vector)
+        with self.lock:
+            if self.index is not None and self.index.ntotal > 0:
+                scores, ids = self.index.search(vector, 1)
+                entry_id = int(ids[0][0])
+                if entry_id in self.entries and scores[0][0] >= self.threshold:
+                    self.entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self.entries[entry_id]["answer"]
+            self.misses += 1
+            return None
+
+    def add(self, query_vector, question, answer):
+        vector = self._normalize(query_vector)
+        with self.lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+
+            entry_id = self.next_id
+            self.next_id += 1
+            self.index.add_with_ids(vector, np.asarray([entry_id], dtype=np.int64))
+            self.entries[entry_id] = {"question": question, "answer": answer}
+
+            # Boyut sınırı: en eski (LRU) kayıtları çıkar
+            evicted = []
+            while len(self.entries) > self.max_entries:
+                old_id, _ = self.entries.popitem(last=False)
+                evicted.append(old_id)
+            if evicted:
+                self.index.remove_ids(np.asarray(evicted, dtype=np.int64))
+
+            self.unsaved += 1
+            should_save = self.path and self.unsaved >= SEMANTIC_CACHE_SAVE_EVERY
+
+        if should_save:
+            self.save()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
 
-        # --- ADIM 1: Çeviri ---
-        translate_prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            if self.index is None:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            tmp_index = os.path.join(self.path, "index.faiss.tmp")
+            tmp_entries = os.path.join(self.path, "entries.jsonl.tmp")
+            faiss.write_index(self.index, tmp_index)
+            with open(tmp_entries, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"corpus_key": self.corpus_key, "next_id": self.next_id}) + "\n")
+                for entry_id, entry in self.entries.items():
+                    f.write(json.dumps({"id": entry_id, **entry}, ensure_ascii=False) + "\n")
+            os.replace(tmp_index, os.path.join(self.path, "index.faiss"))
+            os.replace(tmp_entries, os.path.join(self.path, "entries.jsonl"))
+            self.unsaved = 0
+
+    def load(self):
+        index_path = os.path.join(self.path, "index.faiss")
+        entries_path = os.path.join(self.path, "entries.jsonl")
+        if not (os.path.exists(index_path) and os.path.exists(entries_path)):
+            return
+        with open(entries_path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            # RAG verisi değiştiyse eski cevaplar bayatlamıştır, önbelleği kullanma
+            if header.get("corpus_key") != self.corpus_key:
+                print("🗑️ RAG verisi değişmiş, semantik önbellek sıfırlandı.")
+                return
+            for line in f:
+                item = json.loads(line)
+                self.entries[item["id"]] = {"question": item["question"], "answer": item["answer"]}
+        self.index = faiss.read_index(index_path)
+        self.next_id = header["next_id"]
+        print(f"♻️ Semantik önbellek yüklendi: {len(self.entries)} kayıt")
+
+semantic_cache = None
+if SEMANTIC_CACHE_ENABLED and vector_db:
+    semantic_cache = SemanticCache(
+        SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+        # Soru vektörleri embedding modeline bağlı: backend değişirse önbellek de sıfırlanır
+        path=SEMANTIC_CACHE_DIR, corpus_key=f"{corpus_key}:{embed_model.model_key}",
+    )
+    atexit.register(semantic_cache.save)
+
+# --- PIPELINE ADIMLARI (/chat ve /chat/stream ortak kullanır) ---
+# Sistem bölümleri sabit: KV cache'leri scheduler'da bir kez hesaplanır, her istek sadece kendi kısmını prefill eder
+TRANSLATE_PROMPT_PREFIX = """<|begin_of_text|><|start_header_id|>system<|end_header_id|>
         You are a strict translator. Translate the technical question below to English.
-        RULES: DO NOT answer. ONLY translate. Preserve terms like 'RestClient'.<|eot_id|><|start_header_id|>user<|end_header_id|>
-        {user_question}<|eot_id|><|start_header_id|>assistant<|end_header_id|>"""
-
-        inputs_trans = tokenizer([translate_prompt], return_tensors="pt").to("cuda")
-        outputs_trans = model.generate(**inputs_trans, max_new_tokens=64)
-        english_query = tokenizer.batch_decode(outputs_trans)[0].split("assistant<|end_header_id|>")[-1].replace("<|eot_id|>", "").strip()
+        RULES: DO NOT answer. ONLY translate. Preserve terms like 'RestClient'.<|eot_id|><|start_header_id|>user<|end_header_id|>"""
+inference_scheduler.register_prefix(TRANSLATE_PROMPT_PREFIX)
+
+def build_translate_prompt(user_question):
+    # Llama 3 şablonundaki gibi assistant başlığından sonra "\n\n" prompt'ta yer alır; model onu
+    # kendisi üretseydi "\n\n" stop string'i çeviriyi daha ilk token'da bitirirdi
+    return TRANSLATE_PROMPT_PREFIX + f"""
+        {user_question}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"""
+
+def translate_question(user_question, request_metrics=None):
+    if is_english_question(user_question):
+        print("🇬🇧 Soru zaten İngilizce, çeviri atlandı.")
+        return user_question
+
+    cache_key = normalize_question(user_question)
+    cached = translation_cache.get(cache_key)
+    if cached is not None:
+        print("♻️ Çeviri önbellekten geldi.")
+        return cached
+
+    job = inference_scheduler.run(build_translate_prompt(user_question), **generation_kwargs("translate", user_question))
+    if request_metrics:
+        request_metrics.record_job("translate", job)
+    english_query = job.result.strip()
+    if not english_query:
+        # Boş çeviri önbelleğe alınmaz; boş sorgu her soruyu aynı semantik önbellek kaydına eşlerdi
+        print("⚠️ Çeviri boş döndü, orijinal soru kullanılıyor.")
+        return user_question
+    translation_cache.put(cache_key, english_query)
+    return english_query
+
+# --- BAĞLAM BÜTÇESİ (Context Packing) ---
+# Temizleyici kısa parçaları birleştirdiği için tek bir chunk çok büyük olabilir.
+# Chunk'lar körü körüne eklenmez: alaka sırasıyla, paragraf paragraf, token bütçesi dolana kadar eklenir.
+# Bütçe: MAX_SEQ_LENGTH (2048) - cevap (1024) - sistem prompt'u ve soru için pay.
+CONTEXT_TOKEN_BUDGET = 768
+CONTEXT_CANDIDATES = 6   # Bütçeye sığdırılmak üzere getirilen aday chunk sayısı
+
+PARAGRAPH_SEPARATOR_TOKENS = len(tokenizer.encode("\n\n", add_special_tokens=False))
+
+@lru_cache(maxsize=4096)
+def chunk_paragraphs(text):
+    # Her chunk bir kez tokenize edilir: (paragraf, token sayısı) listesi önbellekte tutulur
+    # Kod bloğu (```) içindeki boş satırlar paragraf sınırı sayılmaz; blok bütün kalır
+    paragraphs, in_fence = [], False
+    for piece in text.split("\n\n"):
+        if in_fence:
+            paragraphs[-1] += "\n\n" + piece
+        else:
+            paragraphs.append(piece)
+        if piece.count("```") % 2:
+            in_fence = not in_fence
+    paragraphs = [p.strip() for p in paragraphs if p.strip()]
+    if not paragraphs:
+        return ()
+    counts = tokenizer(paragraphs, add_special_tokens=False)["input_ids"]
+    return tuple((p, len(ids)) for p, ids in zip(paragraphs, counts))
+
+def trim_to_budget(paragraph, budget):
+    # Tek paragraf bütçeden büyükse satır sınırından kes
+    lines, kept, used = paragraph.split("\n"), [], 0
+    for line in lines:
+        cost = len(tokenizer.encode(line + "\n", add_special_tokens=False))
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept), used
+
+@lru_cache(maxsize=1024)
+def section_header(section):
+    # Chunk'ın bölüm yolu (metadata) bağlamda tek satırlık başlık olarak gösterilir
+    if not section:
+        return "", 0
+    header = f"[{section}]"
+    return header, len(tokenizer.encode(header + "\n", add_special_tokens=False))
+
+def pack_context(docs, budget=CONTEXT_TOKEN_BUDGET):
+    sections, seen, used = [], set(), 0
+    for doc in docs:
+        kept = []
+        header, header_cost = section_header(doc.metadata.get("section"))
+        for paragraph, tokens in chunk_paragraphs(doc.page_content):
+            # Aynı paragraf (ör. örtüşen chunk'lardaki tekrarlar) bir kez girer
+            key = " ".join(paragraph.split()).lower()
+            if key in seen:
+                continue
+            cost = tokens + PARAGRAPH_SEPARATOR_TOKENS + (0 if kept else header_cost)
+            if used + cost > budget:
+                if not sections and not kept:
+                    paragraph, cost = trim_to_budget(paragraph, budget - used - header_cost)
+                    if paragraph:
+                        kept.append(paragraph)
+                        used += cost + header_cost
+                break
+            kept.append(paragraph)
+            seen.add(key)
+            used += cost
+        if kept:
+            body = "\n\n".join(kept)
+            sections.append(f"{header}\n{body}" if header else body)
+        if budget - used <= PARAGRAPH_SEPARATOR_TOKENS:
+            break
+    return "\n\n".join(sections)
+
+# --- CROSS-ENCODER YENİDEN SIRALAMA (Re-rank) ---
+# Vektör/hibrit arama geniş bir aday kümesi getirir; küçük bir cross-encoder (CPU) soru ile her
+# adayı birlikte okuyup tek batch'te puanlar. Eşiğin altındaki parçalar prompt'a hiç girmez:
+# alakasız bağlam hem prefill token'ı harcar hem de modeli uzun, kaçamak cevaplara iter.
+RERANK_ENABLED = True
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Aday sayısı, token sınırı ve bütçe ölçümden seçildi (benchmark_rag_pipeline.py --mode rerank, 1 CPU thread'i):
+#   20 aday x 256 token: p50 1791 ms, p95 2040 ms  (her istek bütçeyi aşardı)
+#   10 aday x 128 token: p50  440 ms, p95  491 ms  (Colab'ın 2 vCPU'sunda daha hızlı)
+RERANK_CANDIDATES = 10      # Puanlanacak aday sayısı
+RERANK_MIN_SCORE = 0.0      # ms-marco logit'i: > 0 alakalı kabul edilir
+RERANK_MIN_KEEP = 1         # Hiçbir aday eşiği geçmezse en iyi N tanesi yine de tutulur
+RERANK_MAX_LENGTH = 128     # Soru + parça token sınırı (bölüm yolu + parçanın başı puanlanır)
+RERANK_BUDGET_MS = 600      # Ölçülen p95'in ~1.2 katı; bu sürede bitmezse ilk arama sırasına dönülür
+
+metrics.counter("chat_rerank_total", "Re-rank sonuçları (outcome: ok, timeout, busy, error)")
+metrics.histogram("chat_rerank_kept", "Re-rank sonrası bağlamda kalan parça sayısı", (0, 1, 2, 3, 4, 6, 8, 12, 20))
+
+class CrossEncoderReranker:
+    """
+    Adayları tek batch'te puanlar ve eşiği geçenleri puan sırasıyla döndürür.
+    Süre bütçesi aşılırsa ya da önceki puanlama hâlâ sürüyorsa None döner; çağıran ilk sırayı kullanır.
+    """
+    def __init__(self, model, budget_ms, min_score, min_keep, max_keep):
+        self.model = model
+        self.budget = budget_ms / 1000
+        self.min_score = min_score
+        self.min_keep = min_keep
+        self.max_keep = max_keep
+        # Tek worker: bütçeyi aşan puanlama arka planda biter, yeni istekler onu beklemez
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self.busy = threading.Semaphore(1)
+
+    def _score(self, query, docs):
+        try:
+            pairs = [(query, indexing_text(d.page_content, d.metadata)) for d in docs]
+            return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        finally:
+            self.busy.release()
+
+    def warmup(self, candidates, max_length):
+        # İlk predict çağrısı kurulum maliyeti taşır (ilk sorgu hep bütçeyi aşardı): yüklemede bir kez yapılır,
+        # ikinci çağrı tam boyutlu bir batch'in süresini ölçer
+        pairs = [("warmup", "spring " * max_length)] * candidates
+        self.model.predict(pairs, batch_size=candidates, show_progress_bar=False)
+        start = time.perf_counter()
+        self.model.predict(pairs, batch_size=candidates, show_progress_bar=False)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > self.budget * 1000:
+            print(f"⚠️ Re-rank {candidates} aday için {elapsed_ms:.0f} ms sürüyor, bütçe {self.budget * 1000:.0f} ms: "
+                  "RERANK_CANDIDATES / RERANK_MAX_LENGTH düşürülmeli.")
+        return elapsed_ms
+
+    def rerank(self, query, docs):
+        if not self.busy.acquire(blocking=False):
+            metrics.inc("chat_rerank_total", outcome="busy")
+            return None
+        try:
+            future = self.executor.submit(self._score, query, docs)
+        except Exception:
+            self.busy.release()
+            raise
+        try:
+            scores = future.result(timeout=self.budget)
+        except FuturesTimeoutError:
+            print(f"⏱️ Re-rank {self.budget * 1000:.0f} ms bütçesini aştı, arama sırası kullanılıyor.")
+            metrics.inc("chat_rerank_total", outcome="timeout")
+            return None
+        except Exception as e:
+            print(f"⚠️ Re-rank hatası, arama sırası kullanılıyor: {e}")
+            metrics.inc("chat_rerank_total", outcome="error")
+            return None
+
+        ranked = sorted(range(len(docs)), key=lambda i: float(scores[i]), reverse=True)
+        kept = [i for i in ranked if scores[i] >= self.min_score][:self.max_keep]
+        if len(kept) < self.min_keep:
+            kept = ranked[:self.min_keep]
+        metrics.inc("chat_rerank_total", outcome="ok")
+        metrics.observe("chat_rerank_kept", len(kept))
+        return [docs[i] for i in kept]
+
+reranker = None
+if RERANK_ENABLED and vector_db:
+    try:
+        from sentence_transformers import CrossEncoder
+        reranker = CrossEncoderReranker(
+            CrossEncoder(RERANK_MODEL_NAME, device="cpu", max_length=RERANK_MAX_LENGTH),
+            RERANK_BUDGET_MS, RERANK_MIN_SCORE, RERANK_MIN_KEEP, CONTEXT_CANDIDATES,
+        )
+        warm_ms = reranker.warmup(RERANK_CANDIDATES, RERANK_MAX_LENGTH)
+        print(f"🎯 Re-rank modeli hazır: {RERANK_MODEL_NAME} ({RERANK_CANDIDATES} aday ~{warm_ms:.0f} ms)")
+    except Exception as e:
+        print(f"⚠️ Re-rank modeli yüklenemedi, arama sırası kullanılacak: {e}")
 
-        print(f"🔍 Aranan (EN): {english_query}")
+def retrieve_documents(english_query, query_vector):
+    if not vector_db:
+        return []
+    # Re-rank açıksa daha geniş aday kümesi getirilir, eleme cross-encoder'a bırakılır
+    k = RERANK_CANDIDATES if reranker else CONTEXT_CANDIDATES
+    if HYBRID_SEARCH_ENABLED:
+        return hybrid_search(english_query, query_vector, k=k, candidates=max(k, HYBRID_CANDIDATES))
+    return vector_db.similarity_search_by_vector(query_vector, k=k)
 
-        # --- ADIM 2: RAG Arama ---
-        context_text = ""
-        if vector_db:
-            docs = vector_db.similarity_search(english_query, k=3)
-            context_text = "\n\n".join([d.page_content for d in docs])
+def rerank_documents(english_query, docs):
+    reranked = reranker.rerank(english_query, docs) if reranker and docs else None
+    return reranked if reranked is not None else docs[:CONTEXT_CANDIDATES]
 
-        # --- ADIM 3: Cevap Üretimi ---
-        rag_prompt = f"""<|begin_of_text|><|start_header_id|>system<|end_header_id|>
+RAG_PROMPT_PREFIX = """<|begin_of_text|><|start_header_id|>system<|end_header_id|>
 
         Sen bir Spring Boot uzmanısın. Aşağıdaki [BAĞLAM] bilgisini kullanarak cevap ver.
 
@@ -508,7 +2497,11 @@ def chat():
         2. KESİNLİKLE eski 'RestTemplate' sınıfını kullanma.
         3. Kodların modern 'Fluent API' yapısında olsun.
         4. Cevap dili Türkçe olsun.
-        <|eot_id|><|start_header_id|>user<|end_header_id|>
+        <|eot_id|><|start_header_id|>user<|end_header_id|>"""
+inference_scheduler.register_prefix(RAG_PROMPT_PREFIX)
+
+def build_rag_prompt(context_text, user_question):
+    return RAG_PROMPT_PREFIX + f"""
 
         [BAĞLAM]:
         {context_text}
@@ -516,29 +2509,347 @@ def chat():
         SORU:
         {user_question}<|eot_id|><|start_header_id|>assistant<|end_header_id|>"""
 
-        inputs = tokenizer([rag_prompt], return_tensors="pt").to("cuda")
-        outputs = model.generate(**inputs, max_new_tokens=1024, use_cache=True, temperature=0.3)
+def prepare_chat(user_question, request_metrics):
+    print(f"📩 Web Arayüzünden Gelen Soru: {user_question}")
+    ctx = {"english_query": None, "query_vector": None, "cached_answer": None, "rag_prompt": None}
+
+    # --- ADIM 1: Çeviri ---
+    with request_metrics.stage("translate"):
+        ctx["english_query"] = translate_question(user_question, request_metrics)
+    print(f"🔍 Aranan (EN): {ctx['english_query']}")
+
+    # --- ADIM 2: RAG Arama (sorgu vektörü bir kez hesaplanır, önbellek + FAISS ortak kullanır) ---
+    if vector_db:
+        with request_metrics.stage("embed"):
+            ctx["query_vector"] = embed_model.embed_query(ctx["english_query"])
+
+        if semantic_cache:
+            with request_metrics.stage("semantic_cache"):
+                ctx["cached_answer"] = semantic_cache.lookup(ctx["query_vector"])
+            if ctx["cached_answer"] is not None:
+                print(f"⚡ Semantik önbellekten cevaplandı. {semantic_cache.stats()}")
+                return ctx
+
+    with request_metrics.stage("retrieve"):
+        docs = retrieve_documents(ctx["english_query"], ctx["query_vector"])
+    with request_metrics.stage("rerank"):
+        docs = rerank_documents(ctx["english_query"], docs)
+
+    # --- ADIM 3: Prompt (bağlam paketleme dahil) ---
+    with request_metrics.stage("prompt"):
+        ctx["rag_prompt"] = build_rag_prompt(pack_context(docs), user_question)
+    return ctx
+
+def remember_answer(ctx, answer):
+    if semantic_cache and ctx["query_vector"] is not None and answer:
+        semantic_cache.add(ctx["query_vector"], ctx["english_query"], answer)
 
-        response = tokenizer.batch_decode(outputs)[0]
-        clean_response = response.split("<|start_header_id|>assistant<|end_header_id|>")[-1].replace("<|eot_id|>", "").strip()
+# --- ROUTE 2: CHAT API (RAG + MODEL) ---
+# Flask ve ASGI route'ları aynı fonksiyonu kullanır: (JSON gövdesi, HTTP durum kodu) döner
+def answer_question(user_question):
+    if not user_question: return {"error": "Soru boş olamaz"}, 400
 
-        return jsonify({
+    request_metrics = RequestMetrics("/chat")
+    try:
+        ctx = prepare_chat(user_question, request_metrics)
+        if ctx["cached_answer"] is not None:
+            request_metrics.finish("cached")
+            return {"response": ctx["cached_answer"], "cached": True}, 200
+
+        # --- ADIM 4: Cevap Üretimi ---
+        job = inference_scheduler.run(ctx["rag_prompt"], **generation_kwargs("answer"))
+        request_metrics.record_job("answer", job)
+        clean_response = job.result.strip()
+        remember_answer(ctx, clean_response)
+        request_metrics.finish("ok")
+
+        return {
             "response": clean_response,
-        })
+            "cached": False,
+        }, 200
+
+    except SchedulerBusyError as e:
+        request_metrics.finish("busy")
+        return {"error": str(e)}, 503
+    except Exception as e:
+        print(f"HATA: {e}")
+        request_metrics.finish("error")
+        return {"error": str(e)}, 500
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    data = request.get_json(silent=True) or {}
+    payload, status = answer_question(data.get('question', ''))
+    return jsonify(payload), status
+
+# --- ROUTE 3: STREAMING CHAT (Server-Sent Events) ---
+# Cevap tamamlanmasını beklemeden, üretilen her token parçası anında tarayıcıya gönderilir.
+def sse_event(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
+def chat_event_stream(user_question):
+    request_metrics = RequestMetrics("/chat/stream")
+    job = None
+    try:
+        ctx = prepare_chat(user_question, request_metrics)
+        if ctx["cached_answer"] is not None:
+            yield sse_event({"token": ctx["cached_answer"]})
+            yield sse_event({"cached": True}, event="done")
+            request_metrics.finish("cached")
+            return
+
+        # --- ADIM 4: Cevap Üretimi (scheduler worker'ında, token token) ---
+        streamer = TextIteratorStreamer(
+            tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=INFERENCE_REQUEST_TIMEOUT
+        )
+        job = inference_scheduler.submit(ctx["rag_prompt"], streamer=streamer, **generation_kwargs("answer"))
+
+        # Stop string'e gelindiğinde (üretim birkaç token sonra durur) istemciye gönderim kesilir
+        stop_strings = GENERATION_PROFILES["answer"]["stop_strings"]
+        answer, sent = "", 0
+        for text in streamer:
+            if text:
+                if not answer:
+                    # İlk token'a kadar geçen süre (time-to-first-token)
+                    request_metrics.add_stage("first_token", time.perf_counter() - request_metrics.started_at)
+                answer += text
+                visible, _ = trim_at_stop(answer, stop_strings)
+                if len(visible) > sent:
+                    yield sse_event({"token": visible[sent:]})
+                    sent = len(visible)
+
+        job.done.wait()
+        if job.error:
+            raise job.error
+        request_metrics.record_job("answer", job)
+        remember_answer(ctx, job.result.strip())   # Stop string'den sonrası kırpılmış hali
+        yield sse_event({"cached": False}, event="done")
+        request_metrics.finish("ok")
+
+    except GeneratorExit:
+        # Üreteç kapatıldı (istemci bağlantıyı kesti): devam eden üretim iptal edilir, GPU boşuna çalışmaz
+        if job is not None:
+            job.cancel()
+        request_metrics.finish("cancelled")
+        raise
+    except SchedulerBusyError as e:
+        yield sse_event({"error": str(e)}, event="error")
+        request_metrics.finish("busy")
     except Exception as e:
         print(f"HATA: {e}")
-        return jsonify({"error": str(e)}), 500
+        yield sse_event({"error": str(e)}, event="error")
+        request_metrics.finish("error")
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    data = request.json or {}
+    user_question = data.get('question', '')
+
+    if not user_question: return jsonify({"error": "Soru boş olamaz"}), 400
+
+    return Response(
+        stream_with_context(chat_event_stream(user_question)),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+# --- ROUTE 4: SEMANTİK ÖNBELLEK İSTATİSTİKLERİ ---
+def collect_cache_stats():
+    stats = {"enabled": bool(semantic_cache)}
+    if semantic_cache:
+        stats.update(semantic_cache.stats())
+    if vector_db:
+        stats["embedding"] = embed_model.stats()
+    return stats
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(collect_cache_stats())
+
+# --- ROUTE 5: PROMETHEUS METRİKLERİ ---
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# --- ASGI SUNUCUSU (uvicorn) ---
+# Flask'ın geliştirme sunucusu yerine: handler'lar async, bloklayan işler (çeviri, arama,
+# üretim beklemesi) ayrı bir thread havuzunda çalışır. Aynı anda işlenen istek sayısı sınırlıdır;
+# fazlası kısa bir kuyrukta bekler, kuyruk doluysa 429, slot zamanında boşalmazsa 503 döner.
+# İkisinde de Retry-After başlığı vardır: yük altında istekler zaman aşımına uğramak yerine hızlıca geri çevrilir.
+SERVER_MODE = "asgi"          # "asgi": uvicorn | "flask": app.run (geliştirme sunucusu)
+SERVER_PORT = 5000
+ASGI_MAX_IN_FLIGHT = 16       # Aynı anda işlenen sohbet isteği (= thread havuzu boyutu)
+ASGI_MAX_WAITING = 32         # Slot bekleyebilecek en fazla istek; üstü 429
+ASGI_ADMISSION_TIMEOUT = 30   # Slot için en fazla bekleme (sn); aşılırsa 503
+
+metrics.counter("chat_admission_rejected_total", "Kabul sınırında geri çevrilen istekler (status: 429, 503)")
+
+class AdmissionRejected(Exception):
+    def __init__(self, status, retry_after):
+        super().__init__(f"{status}, Retry-After: {retry_after}")
+        self.status = status
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Event loop thread'inde kullanılır (kilide gerek yok).
+    Retry-After, son isteklerin ortalama süresinden ve bekleyen istek sayısından tahmin edilir.
+    """
+    def __init__(self, max_in_flight, max_waiting, timeout):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.avg_seconds = 5.0   # İstek süresinin hareketli ortalaması
+
+    def retry_after(self):
+        return max(1, math.ceil(self.avg_seconds * (self.waiting + 1) / self.max_in_flight))
+
+    async def acquire(self):
+        if not self.slots.locked():
+            await self.slots.acquire()   # Boş slot var, beklemeden alınır
+        else:
+            if self.waiting >= self.max_waiting:
+                metrics.inc("chat_admission_rejected_total", status="429")
+                raise AdmissionRejected(429, self.retry_after())
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                metrics.inc("chat_admission_rejected_total", status="503")
+                raise AdmissionRejected(503, self.retry_after())
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+        return time.perf_counter()
+
+    def release(self, started_at):
+        self.in_flight -= 1
+        self.slots.release()
+        self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (time.perf_counter() - started_at)
+
+admission = AdmissionController(ASGI_MAX_IN_FLIGHT, ASGI_MAX_WAITING, ASGI_ADMISSION_TIMEOUT)
+chat_executor = ThreadPoolExecutor(max_workers=ASGI_MAX_IN_FLIGHT, thread_name_prefix="chat")
+metrics.gauge("chat_admission_in_flight", "ASGI: işlenmekte olan sohbet isteği", lambda: admission.in_flight)
+metrics.gauge("chat_admission_waiting", "ASGI: slot bekleyen sohbet isteği", lambda: admission.waiting)
+
+def rejected_response(error):
+    return JSONResponse(
+        {"error": "Sunucu şu an çok yoğun, lütfen biraz sonra tekrar deneyin."},
+        status_code=error.status, headers={"Retry-After": str(error.retry_after)},
+    )
+
+async def read_question(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return ""
+    return data.get("question", "") if isinstance(data, dict) else ""
+
+async def iterate_in_executor(iterator):
+    # Senkron üreteç (SSE olayları) her adımda thread havuzunda ilerletilir; event loop bloklanmaz
+    done = object()
+    step = None
+    try:
+        while True:
+            step = chat_executor.submit(next, iterator, done)
+            item = await asyncio.wrap_future(step)
+            if item is done:
+                break
+            yield item
+    finally:
+        # Akış yarıda kesildiyse üreteç kapatılır (scheduler işi iptal edilir). Thread'de hâlâ
+        # çalışan bir adım varsa kapatma o adım bittikten sonra yapılır (çalışan üreteç kapatılamaz)
+        if step is not None:
+            step.add_done_callback(lambda _: chat_executor.submit(iterator.close))
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Admission slot'unu tutan akış yanıtı. Slot, gövde üreteci hiç başlamasa bile
+    (istemci akış başlamadan koptu) yanıt gönderimi bittiğinde bırakılır.
+    """
+    def __init__(self, content, started_at, **kwargs):
+        super().__init__(content, **kwargs)
+        self.started_at = started_at
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(self.started_at)
+            await self.body_iterator.aclose()
+
+async def asgi_home(request):
+    return HTMLResponse(HTML_TEMPLATE)
+
+async def asgi_chat(request):
+    user_question = await read_question(request)
+    if not user_question:
+        return JSONResponse({"error": "Soru boş olamaz"}, status_code=400)
+    try:
+        started_at = await admission.acquire()
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    try:
+        payload, status = await asyncio.get_running_loop().run_in_executor(chat_executor, answer_question, user_question)
+    finally:
+        admission.release(started_at)
+    headers = {"Retry-After": str(admission.retry_after())} if status == 503 else None
+    return JSONResponse(payload, status_code=status, headers=headers)
+
+async def asgi_chat_stream(request):
+    user_question = await read_question(request)
+    if not user_question:
+        return JSONResponse({"error": "Soru boş olamaz"}, status_code=400)
+    try:
+        started_at = await admission.acquire()
+    except AdmissionRejected as e:
+        return rejected_response(e)
+
+    # Slot, akış bitene (ya da istemci bağlantıyı kapatana) kadar tutulur
+    return AdmittedStreamingResponse(
+        iterate_in_executor(chat_event_stream(user_question)), started_at,
+        media_type="text/event-stream", headers=SSE_HEADERS,
+    )
+
+async def asgi_cache_stats(request):
+    return JSONResponse(collect_cache_stats())
+
+async def asgi_metrics(request):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+asgi_app = Starlette(
+    routes=[
+        Route("/", asgi_home, methods=["GET"]),
+        Route("/chat", asgi_chat, methods=["POST"]),
+        Route("/chat/stream", asgi_chat_stream, methods=["POST"]),
+        Route("/cache/stats", asgi_cache_stats, methods=["GET"]),
+        Route("/metrics", asgi_metrics, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+)
 
 # Ngrok Tüneli
 ngrok.kill()
 try:
-    public_url = ngrok.connect(5000, domain=NGROK_STATIC_DOMAIN).public_url
+    public_url = ngrok.connect(SERVER_PORT, domain=NGROK_STATIC_DOMAIN).public_url
     print(f"\n🚀 SİTE YAYINDA! (Sabit Domain)")
 except:
     print(f"\n⚠️ Sabit Domain hatası, rastgele domain deneniyor...")
-    public_url = ngrok.connect(5000).public_url
+    public_url = ngrok.connect(SERVER_PORT).public_url
 
 print(f"👉 Arayüze Gitmek İçin Tıkla: {public_url}")
 
-app.run(port=5000)
+if SERVER_MODE == "asgi":
+    # Colab/Jupyter hücresinde zaten bir event loop çalışıyor: uvicorn kendi thread'inde, kendi loop'uyla başlar
+    asgi_server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=SERVER_PORT, log_level="warning"))
+    server_thread = Thread(target=asgi_server.run, daemon=True)
+    server_thread.start()
+    server_thread.join()
+else:
+    app.run(port=SERVER_PORT)
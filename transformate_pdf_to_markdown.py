@@ -1,47 +1,161 @@
 import os
 import json
-from llama_parse import LlamaParse
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import pymupdf
 from tqdm import tqdm
 
 # Buraya LlamaCloud'dan aldığınız API anahtarını girin
-os.environ["LLAMA_CLOUD_API_KEY"] = "llx-....." 
+os.environ["LLAMA_CLOUD_API_KEY"] = "llx-....."
 
 PDF_PATH = "spring-boot-reference.pdf"
 OUTPUT_JSON = "rag_data.json"
+SOURCE_NAME = "Spring Boot Reference"
+
+# Ayrıştırıcı: "llamaparse" (bulut, API anahtarı gerekir) veya "local" (PyMuPDF, internetsiz)
+PARSER_BACKEND = os.environ.get("PDF_PARSER_BACKEND", "llamaparse")
+PARSE_WORKERS = os.cpu_count() or 1
+PAGES_PER_TASK = 16                 # Süreç havuzuna tek seferde verilen sayfa sayısı
+
+# --- SAYFA ÖNBELLEĞİ ---
+# Her sayfa tek başına bir PDF'e kopyalanıp hash'lenir; Markdown çıktısı bu hash ile saklanır.
+# PDF'in yeni sürümünde sadece değişen sayfalar yeniden ayrıştırılır (buluta da sadece onlar yüklenir).
+PAGE_CACHE_DIR = "pdf_page_cache"   # <backend>/<sayfa hash'i>.md
+
+# --- SÜREÇ HAVUZU İŞÇİLERİ ---
+# Her işçi süreci PDF'i bir kez açar; görevler sadece sayfa numaralarını taşır.
+_worker_doc = None
+
+def _open_worker(pdf_path):
+    global _worker_doc
+    _worker_doc = pymupdf.open(pdf_path)
+
+def single_page_pdf(doc, page_no):
+    # no_new_id: aynı sayfa her çalıştırmada bayt bayt aynı PDF'i verir (hash kararlı kalır)
+    single = pymupdf.open()
+    single.insert_pdf(doc, from_page=page_no, to_page=page_no)
+    data = single.tobytes(garbage=3, deflate=True, no_new_id=True)
+    single.close()
+    return data
+
+def fingerprint_pages(page_nos):
+    rows = []
+    for page_no in page_nos:
+        digest = hashlib.sha256(single_page_pdf(_worker_doc, page_no)).hexdigest()[:24]
+        label = _worker_doc[page_no].get_label() or str(page_no + 1)
+        rows.append((page_no, label, digest))
+    return rows
+
+def parse_pages_locally(page_nos):
+    import pymupdf4llm
+    rows = []
+    for page_no in page_nos:
+        # Sayfa, hash'lenen tek sayfalık PDF'ten ayrıştırılır: çıktı sadece o sayfanın baytlarına bağlıdır
+        page_doc = pymupdf.open("pdf", single_page_pdf(_worker_doc, page_no))
+        rows.append((page_no, pymupdf4llm.to_markdown(page_doc)))
+        page_doc.close()
+    return rows
+
+def run_in_pool(func, pdf_path, page_nos, desc):
+    tasks = [page_nos[i:i + PAGES_PER_TASK] for i in range(0, len(page_nos), PAGES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS, initializer=_open_worker, initargs=(pdf_path,)) as pool:
+        for rows in tqdm(pool.map(func, tasks), total=len(tasks), desc=desc):
+            yield from rows
+
+# --- AYRIŞTIRICILAR ---
+# Ortak arayüz: parse_pages(pdf_path, page_nos) -> {sayfa no: markdown}
+class LocalParser:
+    """
+    PyMuPDF + pymupdf4llm ile yerel ayrıştırma: sayfalar süreç havuzunda paralel işlenir.
+    Başlıklar font boyutundan çıkarılır; tablolar LlamaParse kadar iyi olmayabilir.
+    """
+    name = "local"
+
+    def parse_pages(self, pdf_path, page_nos):
+        return dict(run_in_pool(parse_pages_locally, pdf_path, page_nos, "Yerel ayrıştırma"))
+
+class LlamaParseParser:
+    """
+    LlamaCloud ile ayrıştırma (tabloları markdown'a çevirir).
+    Sadece istenen sayfalar tek bir PDF'te toplanıp yüklenir; sonuç sayfa başına bir doküman olarak döner.
+    """
+    name = "llamaparse"
+
+    def parse_pages(self, pdf_path, page_nos):
+        from llama_parse import LlamaParse
+        parser = LlamaParse(
+            result_type="markdown",
+            verbose=True,
+            language="en",
+            num_workers=4
+        )
+        with pymupdf.open(pdf_path) as source, pymupdf.open() as subset:
+            for page_no in page_nos:
+                subset.insert_pdf(source, from_page=page_no, to_page=page_no)
+            payload = subset.tobytes(garbage=3, deflate=True)
+
+        print(f"{len(page_nos)} sayfa buluta yükleniyor ve işleniyor (Bu işlem tablolara göre 1-2 dk sürebilir)...")
+        documents = parser.load_data(payload, extra_info={"file_name": os.path.basename(pdf_path)})
+        if len(documents) != len(page_nos):
+            raise RuntimeError(f"LlamaParse {len(page_nos)} sayfa için {len(documents)} doküman döndürdü")
+        return {page_no: doc.text for page_no, doc in zip(page_nos, documents)}
+
+PARSERS = {"local": LocalParser, "llamaparse": LlamaParseParser}
+
+def cache_path(backend, digest):
+    return os.path.join(PAGE_CACHE_DIR, backend, f"{digest}.md")
+
+def read_cached_page(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def write_cached_page(path, markdown):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(markdown)
+    os.replace(tmp_path, path)
 
 def main():
-    print(f"--- LlamaParse ile Akıllı Dönüştürme Başlıyor: {PDF_PATH} ---")
-    
-    # LlamaParse ayarları (Tabloları markdown'a çevirir)
-    parser = LlamaParse(
-        result_type="markdown", 
-        verbose=True,
-        language="en",
-        num_workers=4
-    )
-    
-    # PDF'i işle
-    print("Doküman buluta yükleniyor ve işleniyor (Bu işlem tablolara göre 1-2 dk sürebilir)...")
-    documents = parser.load_data(PDF_PATH)
-    
+    parser = PARSERS[PARSER_BACKEND]()
+    print(f"--- {parser.name} ile Akıllı Dönüştürme Başlıyor: {PDF_PATH} ---")
+
+    with pymupdf.open(PDF_PATH) as doc:
+        page_count = doc.page_count
+    pages = sorted(run_in_pool(fingerprint_pages, PDF_PATH, list(range(page_count)), "Sayfa hash'leri"))
+
+    # Önbellekte olmayan sayfalar (aynı içerikli sayfalar bir kez ayrıştırılır)
+    markdown, missing = {}, {}
+    for page_no, _, digest in pages:
+        path = cache_path(parser.name, digest)
+        if os.path.exists(path):
+            markdown[digest] = read_cached_page(path)
+        else:
+            missing.setdefault(digest, page_no)
+    print(f"♻️ {page_count - len(missing)} sayfa önbellekten geldi, {len(missing)} sayfa ayrıştırılacak.")
+
+    if missing:
+        digest_of = {page_no: digest for digest, page_no in missing.items()}
+        parsed = parser.parse_pages(PDF_PATH, sorted(digest_of))
+        for page_no, text in parsed.items():
+            write_cached_page(cache_path(parser.name, digest_of[page_no]), text)
+            markdown[digest_of[page_no]] = text
+
     final_chunks = []
-    
-    # Gelen veriyi chunk formatına sok
-    for doc in tqdm(documents, desc="Veri işleniyor"):
-        # LlamaParse zaten markdown verdiği için ekstra temizliğe çok az ihtiyaç duyar
+    for page_no, label, digest in pages:
         final_chunks.append({
-            "content": doc.text,
+            "content": markdown[digest],
             "metadata": {
-                "source": "Spring Boot Reference",
-                "page_label": doc.metadata.get('page_label', 'unknown') # Hangi sayfadan geldiği
+                "source": SOURCE_NAME,
+                "page_label": label # Hangi sayfadan geldiği
             }
         })
 
     # Kaydet
     with open(OUTPUT_JSON, 'w', encoding='utf-8') as f:
         json.dump(final_chunks, f, ensure_ascii=False, indent=2)
-        
+
     print(f"\n[BAŞARILI] Mükemmel temizlikte veri kaydedildi: {OUTPUT_JSON}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()